@@ -0,0 +1 @@
+"""Poropyck benchmarks (run with asv)"""
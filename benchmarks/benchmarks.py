@@ -0,0 +1,140 @@
+"""Timing and peak memory of the picking hot paths
+
+Run with ``asv run`` (or ``asv run --python=same --quick`` against the
+current environment). Synthetic traces span 1k to 1M samples; the demo CSV
+files cover loading and full picks.
+"""
+import os
+import tempfile
+
+import numpy as np
+
+# import modules rather than classes, as asv would collect any class with
+# a method named like a benchmark (PickSession.time, for example)
+import poropyck
+from poropyck.loader import load_trace, read_csv
+from poropyck.session import ALIGNMENTS
+from poropyck.warping import dtw
+
+DEMO = os.path.join(os.path.dirname(__file__), os.pardir, 'demo')
+TEMPLATE = os.path.join(DEMO, 'NM8A-2087-4B_8000_PP_sat500_u1.csv')
+QUERY = os.path.join(DEMO, 'NM8A-2087-4B_7000_PP_sat500_u1.csv')
+LENGTHS = [5.256, 5.25, 5.254, 5.254, 5.252, 5.252, 5.258, 5.265, 5.255,
+           5.252]
+SIZES = [1000, 10000, 100000, 1000000]
+
+
+def synthetic_trace(size, delay=0.0, seed=0):
+    """return (times, signal) of a noisy decaying wavelet starting at 40%"""
+    rng = np.random.default_rng(seed)
+    times = np.linspace(0.0, 40.0, size)
+    onset = 16.0 + delay
+    after = np.clip(times - onset, 0.0, None)
+    signal = (np.sin(2 * np.pi * after) * np.exp(-after / 4) *
+              (times >= onset) + rng.normal(scale=0.01, size=size))
+    return np.array([times, signal])
+
+
+def synthetic_session(size):
+    """return a pick session over two shifted synthetic traces"""
+    return poropyck.PickSession(synthetic_trace(size),
+                                synthetic_trace(size, 0.3, 1), LENGTHS)
+
+
+class Import:
+    """start-up of a fresh interpreter, as paid by every batch worker"""
+
+    def timeraw_import(self):
+        return 'import poropyck'
+
+    def timeraw_import_plotting(self):
+        # what importing poropyck cost while pick_dtw imported these eagerly
+        return ('import poropyck, matplotlib.pyplot, mpl_toolkits.mplot3d, '
+                'scipy.signal, scipy.stats')
+
+    def timeraw_worker_pick(self):
+        return ('import poropyck; '
+                'poropyck.DTW({!r}, {!r}, {!r}).pick_auto()'.format(
+                    os.path.abspath(TEMPLATE), os.path.abspath(QUERY),
+                    LENGTHS))
+
+
+class Load:
+    """parsing waveform files"""
+
+    def setup(self):
+        self.cache_dir = tempfile.mkdtemp()
+        load_trace(TEMPLATE, self.cache_dir)
+
+    def time_loadtxt(self):
+        read_csv(TEMPLATE)
+
+    def time_cached(self):
+        load_trace(TEMPLATE, self.cache_dir)
+
+    def peakmem_loadtxt(self):
+        read_csv(TEMPLATE)
+
+
+class Onset:
+    """AIC onset picking"""
+    params = SIZES
+    param_names = ['samples']
+
+    def setup(self, size):
+        self.signal = synthetic_trace(size)[1]
+        self.stack = np.tile(self.signal[:1000], (100, 1))
+
+    def time_aic(self, size):
+        poropyck.aic(self.signal)
+
+    def peakmem_aic(self, size):
+        poropyck.aic(self.signal)
+
+    def time_aic_stack(self, size):
+        poropyck.aic(self.stack)
+
+
+class Window:
+    """cutting out the picked window and its Hilbert transform"""
+    params = SIZES
+    param_names = ['samples']
+
+    def setup(self, size):
+        self.session = synthetic_session(size)
+        self.window = self.session.window('query')
+
+    def time_picked(self, size):
+        self.session.set_window('query', *self.window)
+        self.session.picked('query')
+
+    def time_hilbert(self, size):
+        self.session.set_window('query', *self.window)
+        self.session.envelope('query')
+        self.session.phase('query')
+
+
+class Alignment:
+    """each DTW alignment of the default windows"""
+    params = (SIZES[:3], ALIGNMENTS)
+    param_names = ['samples', 'kind']
+
+    def setup(self, size, kind):
+        session = synthetic_session(size)
+        self.series = session._series(kind)  # pylint: disable=protected-access
+
+    def time_dtw(self, size, kind):
+        dtw(*self.series)
+
+    def peakmem_dtw(self, size, kind):
+        dtw(*self.series)
+
+
+class Pick:
+    """a full headless pick of a demo pair"""
+
+    def time_pick_auto(self):
+        poropyck.DTW(TEMPLATE, QUERY, LENGTHS).pick_auto()
+
+    def peakmem_pick_auto(self):
+        poropyck.DTW(TEMPLATE, QUERY, LENGTHS).pick_auto()
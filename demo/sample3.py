@@ -0,0 +1,6 @@
+"""Sample 3: headless batch compare"""
+from poropyck.batch import run_manifest
+
+# the guard is required because worker processes re-import this script
+if __name__ == '__main__':
+    run_manifest('sample2_input.json', 'sample3_output.json', workers=4)
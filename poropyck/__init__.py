@@ -1,2 +1,8 @@
 """Poropyck init"""
-from .pick_dtw import DTW
+from .pick_dtw import DTW, pick_batch
+from .onset import aic, aic_curve, propose_windows
+from .session import PickSession
+from .timing import Timer
+from .memo import AlignmentCache
+from .velocity import velocity_report
+from .store import ResultStore
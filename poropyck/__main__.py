@@ -0,0 +1,6 @@
+"""Run the ``poropyck`` command with ``python -m poropyck``"""
+import sys
+
+from .cli import main
+
+sys.exit(main())
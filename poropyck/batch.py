@@ -0,0 +1,118 @@
+"""Parallel batch picking of template/query chains"""
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import json
+import os
+import textwrap
+
+from .pick_dtw import DTW
+from .store import ResultStore
+
+
+def manifest_pairs(manifest):
+    """return the (template, query) wave pairs of a manifest
+
+    A manifest has the layout of ``demo/sample2_input.json``: each wave is
+    compared with the one before it, so the last wave is never a template
+    and the first wave is never a query.
+    """
+    waves = manifest['waves']
+    return list(zip(waves[:-1], waves[1:]))
+
+
+def pick_pair(template, query, length_data, base_dir='', **kwargs):
+    """headless pick of one pair of manifest waves
+
+    File names are resolved relative to ``base_dir`` but reported exactly
+    as they appear in the manifest.
+    """
+    dtw = DTW(
+        os.path.join(base_dir, template['file']),
+        os.path.join(base_dir, query['file']),
+        length_data,
+        **kwargs
+    )
+    result = dtw.pick_auto()
+    result['file'] = query['file']
+    result['template']['file'] = template['file']
+    return result
+
+
+def _pick_pair(args):
+    """process pool entry point"""
+    (template, query), length_data, base_dir, kwargs = args
+    return pick_pair(template, query, length_data, base_dir, **kwargs)
+
+
+def pick_manifest(manifest, base_dir='', workers=None, chunksize=1, **kwargs):
+    """yield the picks of a manifest in input order
+
+    Pairs are spread over a pool of ``workers`` processes (all cores by
+    default), ``chunksize`` pairs at a time. With ``workers=1`` the pairs are
+    picked in this process. Extra keyword arguments are passed to ``DTW``.
+    """
+    tasks = zip(
+        manifest_pairs(manifest),
+        itertools.repeat(manifest['lengths']),
+        itertools.repeat(base_dir),
+        itertools.repeat(kwargs)
+    )
+    if workers == 1:
+        yield from map(_pick_pair, tasks)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(_pick_pair, tasks, chunksize=chunksize)
+
+
+def wave_columns(manifest, template, query):
+    """return the extra store columns of a pick
+
+    These are the scalar entries of the manifest (such as ``wave_type`` or a
+    ``sample`` name) and the fields of both waves other than their file
+    (such as ``pressure``), those of the template prefixed ``template_``.
+    """
+    columns = {key: value for key, value in manifest.items()
+               if isinstance(value, (str, int, float))}
+    columns.update((key, value) for key, value in query.items()
+                   if key != 'file')
+    columns.update(('template_' + key, value)
+                   for key, value in template.items() if key != 'file')
+    return columns
+
+
+def run_manifest(input_path, output_path, workers=None, chunksize=1,
+                 store=None, **kwargs):
+    """pick every pair of a JSON manifest and write the output JSON
+
+    The output has the layout of ``demo/sample2_output.json``. Each pick is
+    written to the file as soon as it (and every pick before it) is done.
+    It is also appended to ``store`` (a ``poropyck.store.ResultStore`` or
+    its directory) if given, with the columns of ``wave_columns``. Wave
+    files are found relative to the manifest. Returns the output data.
+    """
+    with open(input_path) as jsonfile:
+        data = json.load(jsonfile)
+    data = {key: value for key, value in data.items() if key != 'picks'}
+    base_dir = os.path.dirname(input_path)
+    picks = pick_manifest(data, base_dir, workers, chunksize, **kwargs)
+    if isinstance(store, str):
+        store = ResultStore(store)
+
+    # write the manifest, then stream the picks into its last entry
+    head = json.dumps(dict(data, picks=[]), indent=2)
+    data['picks'] = []
+    with open(output_path, 'w') as jsonfile:
+        jsonfile.write(head[:head.rindex('[]') + 1])
+        for (template, query), pick in zip(manifest_pairs(data), picks):
+            if store is not None:
+                store.append(pick, **wave_columns(data, template, query))
+            if data['picks']:
+                jsonfile.write(',')
+            jsonfile.write('\n' + textwrap.indent(
+                json.dumps(pick, indent=2), '    '))
+            jsonfile.flush()
+            data['picks'].append(pick)
+        jsonfile.write('\n  ]\n}' if data['picks'] else ']\n}')
+    if store is not None:
+        store.flush()
+    return data
@@ -0,0 +1,221 @@
+"""The ``poropyck`` command: resumable headless picking of a manifest
+
+Every finished pair is appended to a checkpoint (a ``ResultStore``) under a
+key made from the contents of both wave files, the lengths and the DTW
+options. A rerun skips the pairs whose key is already there, so an
+interrupted run carries on where it stopped, and the output JSON is written
+from the checkpoint once every pair is done.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import json
+import os
+import sys
+import time
+
+from .batch import manifest_pairs, pick_pair, wave_columns
+from .loader import file_hash
+from .store import PICK_COLUMNS, TEMPLATE_COLUMNS, ResultStore
+from .timing import Timer
+
+
+def pair_key(template_hash, query_hash, length_data, dtw_options=None):
+    """return the checkpoint key of a pair of wave files"""
+    text = json.dumps([template_hash, query_hash, length_data,
+                       dtw_options or {}], sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def output_path(input_path):
+    """return the default output file of a manifest (``*_output.json``)"""
+    root, extension = os.path.splitext(input_path)
+    if root.endswith('_input'):
+        root = root[:-len('_input')]
+    return root + '_output' + (extension or '.json')
+
+
+def _pick(task):
+    """process pool entry point: pick one pair, timing its stages"""
+    index, template, query, length_data, base_dir, kwargs = task
+    timer = Timer()
+    try:
+        result = pick_pair(template, query, length_data, base_dir,
+                           timer=timer, **kwargs)
+        error = None
+    except Exception as exc:  # pylint: disable=broad-except
+        result, error = None, '{}: {}'.format(type(exc).__name__, exc)
+    return index, result, error, timer.stages
+
+
+def _results(tasks, workers):
+    """yield the results of the tasks as they complete"""
+    if workers == 1:
+        yield from map(_pick, tasks)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_pick, task) for task in tasks]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def run(input_path, output=None, checkpoint=None, workers=None,
+        timings=None, quiet=False, **kwargs):
+    """pick every pair of a manifest that is not yet checkpointed
+
+    Returns ``(done, skipped, failed)`` pair counts. The output JSON is
+    only written once no pair has failed. Extra keyword arguments are
+    passed to ``DTW``.
+    """
+    def report(message):
+        if not quiet:
+            print(message, file=sys.stderr)
+
+    output = output or output_path(input_path)
+    store = ResultStore(checkpoint or output + '.checkpoint')
+    with open(input_path) as jsonfile:
+        data = json.load(jsonfile)
+    data = {key: value for key, value in data.items() if key != 'picks'}
+    base_dir = os.path.dirname(input_path)
+    pairs = manifest_pairs(data)
+
+    hashes = {}
+    keys = []
+    unreadable = []
+    for template, query in pairs:
+        try:
+            for wave in (template, query):
+                if wave['file'] not in hashes:
+                    hashes[wave['file']] = file_hash(
+                        os.path.join(base_dir, wave['file']))
+        except OSError as exc:
+            # an unreadable wave fails its pairs, not the whole run
+            keys.append(None)
+            unreadable.append('failed {}: {}: {}'.format(
+                query['file'], type(exc).__name__, exc))
+            continue
+        keys.append(pair_key(hashes[template['file']], hashes[query['file']],
+                             data['lengths'], kwargs.get('dtw_options')))
+    finished = set(store.read(['pair_key']).get('pair_key', []))
+    tasks = [(i, template, query, data['lengths'], base_dir, kwargs)
+             for i, (template, query) in enumerate(pairs)
+             if keys[i] is not None and keys[i] not in finished]
+    skipped = len(pairs) - len(tasks) - len(unreadable)
+    report('{} pairs, {} already done'.format(len(pairs), skipped))
+    for message in unreadable:
+        report(message)
+
+    timer = Timer()
+    done = failed = 0
+    started = time.perf_counter()
+    try:
+        for index, result, error, stages in _results(tasks, workers):
+            template, query = pairs[index]
+            if error is not None:
+                failed += 1
+                report('failed {}: {}'.format(query['file'], error))
+                continue
+            store.append(result, pair_key=keys[index],
+                         **wave_columns(data, template, query))
+            timer.merge(stages)
+            done += 1
+            elapsed = time.perf_counter() - started
+            report('[{}/{}] {} ({:.2f} pairs/s)'.format(
+                done + failed, len(tasks), query['file'], done / elapsed))
+    except KeyboardInterrupt:
+        report('interrupted: {} pairs checkpointed in {}, rerun to resume'
+               .format(done, store.directory))
+        raise
+    finally:
+        store.flush()
+    elapsed = time.perf_counter() - started
+    failed += len(unreadable)
+
+    summary = {
+        'pairs': len(pairs),
+        'done': done,
+        'skipped': skipped,
+        'failed': failed,
+        'seconds': elapsed,
+        'pairs_per_second': done / elapsed if elapsed else 0.0,
+        'stages': timer.as_dict()['stages']
+    }
+    report(format_summary(summary))
+    if timings:
+        with open(timings, 'w') as jsonfile:
+            json.dump(summary, jsonfile, indent=2)
+    if not failed:
+        write_output(data, keys, store, output)
+        report('wrote {}'.format(output))
+    return done, skipped, failed
+
+
+def format_summary(summary):
+    """return the throughput and stage timings of a run as a text table"""
+    lines = ['{done} picked, {skipped} skipped, {failed} failed in '
+             '{seconds:.2f} s ({pairs_per_second:.2f} pairs/s)'.format(
+                 **summary)]
+    if summary['stages']:
+        lines.append('{:<20}{:>8}{:>12}{:>12}'.format(
+            'stage', 'calls', 'total s', 'mean ms'))
+    stages = sorted(summary['stages'].items(),
+                    key=lambda item: -item[1]['seconds'])
+    for name, stage in stages:
+        lines.append('{:<20}{:>8}{:>12.3f}{:>12.3f}'.format(
+            name, stage['calls'], stage['seconds'],
+            1e3 * stage['seconds'] / stage['calls']))
+    return '\n'.join(lines)
+
+
+def write_output(data, keys, store, path):
+    """write the output JSON of a manifest from its checkpointed picks"""
+    picks = {pick['pair_key']: pick for pick in store.picks()}
+    data = dict(data, picks=[])
+    for key in keys:
+        pick = picks[key]
+        record = {name: pick[name] for name in PICK_COLUMNS}
+        record['template'] = {name: pick['template'][name]
+                              for name in TEMPLATE_COLUMNS}
+        data['picks'].append(record)
+    with open(path, 'w') as jsonfile:
+        json.dump(data, jsonfile, indent=2)
+
+
+def main(argv=None):
+    """entry point of the ``poropyck`` console script"""
+    parser = argparse.ArgumentParser(
+        prog='poropyck',
+        description='Pick every (template, query) pair of a JSON manifest '
+                    'without a display, resuming any earlier run.')
+    parser.add_argument('manifest', help='input JSON, as sample2_input.json')
+    parser.add_argument('-o', '--output',
+                        help='output JSON (default: *_output.json)')
+    parser.add_argument('-c', '--checkpoint',
+                        help='checkpoint directory '
+                             '(default: OUTPUT.checkpoint)')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='worker processes (default: all cores)')
+    parser.add_argument('--cache-dir', help='directory of parsed traces')
+    parser.add_argument('--dtw-options', type=json.loads,
+                        help='DTW options as JSON, e.g. \'{"radius": 50}\'')
+    parser.add_argument('--timings',
+                        help='also write throughput and stage timings to '
+                             'this JSON file')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='only report errors')
+    args = parser.parse_args(argv)
+    kwargs = {}
+    if args.cache_dir:
+        kwargs['cache_dir'] = args.cache_dir
+    if args.dtw_options:
+        kwargs['dtw_options'] = args.dtw_options
+    try:
+        _, _, failed = run(args.manifest, args.output, args.checkpoint,
+                           args.workers, args.timings, args.quiet, **kwargs)
+    except KeyboardInterrupt:
+        return 130
+    return 1 if failed else 0
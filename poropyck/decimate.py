@@ -0,0 +1,56 @@
+"""Min/max decimation of long traces for drawing"""
+import numpy as np
+
+
+class MinMaxPyramid:
+    """min/max pyramid of a series, for drawing it at any resolution
+
+    Level ``k`` splits the series into bins of ``factor**k`` samples and
+    keeps the positions of the smallest and largest sample of each bin.
+    Drawing those two samples for every bin, with about one bin per pixel,
+    looks the same as drawing every sample, so no peak is ever lost.
+    """
+
+    def __init__(self, times, values, factor=4):
+        self.times = np.asarray(times)
+        values = np.asarray(values, dtype=float)
+        self.levels = []
+        low = high = np.arange(len(values))
+        size = 1
+        while len(low) > 1:
+            bins = -(-len(low) // factor)
+            low = _pad(low, bins * factor).reshape(bins, factor)
+            high = _pad(high, bins * factor).reshape(bins, factor)
+            rows = np.arange(bins)
+            low = low[rows, np.argmin(values[low], axis=1)]
+            high = high[rows, np.argmax(values[high], axis=1)]
+            size *= factor
+            self.levels.append((size, low, high))
+
+    def select(self, start, stop, pixels):
+        """return the sample indices to draw between two times
+
+        The coarsest level that still has a bin per pixel is used, and one
+        extra sample on each side keeps the line running to the axes edges.
+        """
+        first = max(np.searchsorted(self.times, start, 'left') - 1, 0)
+        last = min(np.searchsorted(self.times, stop, 'right') + 1,
+                   len(self.times))
+        level = None
+        for size, low, high in self.levels:
+            if (last - first) / size < pixels:
+                break
+            level = size, low, high
+        if level is None:
+            return np.arange(first, last)
+        size, low, high = level
+        bins = slice(first // size, -(-last // size))
+        low, high = low[bins], high[bins]
+        # keep the two samples of each bin in time order
+        return np.column_stack(
+            [np.minimum(low, high), np.maximum(low, high)]).ravel()
+
+
+def _pad(indices, length):
+    """repeat the last index up to a length"""
+    return np.append(indices, np.repeat(indices[-1], length - len(indices)))
@@ -0,0 +1,158 @@
+"""Waveform file loading"""
+import hashlib
+import itertools
+import os
+import warnings
+
+import numpy as np
+
+SKIP_ROWS_IN_CSV = 21
+CACHE_DIR_VARIABLE = 'POROPYCK_CACHE_DIR'
+CHUNK_ROWS = 65536
+
+
+def count_rows(path):
+    """return the number of rows after the header of a CSV waveform file
+
+    Only newlines are counted, so blank lines make this an upper bound on
+    the number of samples.
+    """
+    newlines = 0
+    last = b'\n'
+    with open(path, 'rb') as csvfile:
+        for block in iter(lambda: csvfile.read(1 << 20), b''):
+            newlines += block.count(b'\n')
+            last = block
+    # a last line without a newline still holds a sample
+    newlines += not last.endswith(b'\n')
+    return max(newlines - SKIP_ROWS_IN_CSV, 0)
+
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS):
+    """yield the (times, signal) data of a CSV waveform file in chunks
+
+    The header is skipped once and the body parsed ``chunk_rows`` rows at a
+    time, so only one chunk of text is held in memory.
+    """
+    with open(path) as csvfile, warnings.catch_warnings():
+        # the read that finds the end of the file warns it found no data,
+        # and numpy warns about blank lines, which are skipped as before
+        warnings.filterwarnings('ignore', 'loadtxt: input contained no data')
+        warnings.filterwarnings('ignore', 'Input line .* contained no data')
+        for _ in itertools.islice(csvfile, SKIP_ROWS_IN_CSV):
+            pass
+        while True:
+            chunk = np.loadtxt(csvfile, delimiter=',', usecols=(0, 1),
+                               ndmin=2, max_rows=chunk_rows)
+            if not len(chunk):
+                return
+            yield chunk.T
+
+
+def fill(path, data, chunk_rows=CHUNK_ROWS):
+    """parse a CSV waveform file into a (2, count_rows) array
+
+    ``data`` may be a memory map, so a trace larger than memory can be
+    parsed. Returns the number of samples written.
+    """
+    filled = 0
+    for chunk in read_chunks(path, chunk_rows):
+        data[:, filled:filled + chunk.shape[1]] = chunk
+        filled += chunk.shape[1]
+    return filled
+
+
+def read_csv(path, start=None, end=None, chunk_rows=CHUNK_ROWS):
+    """parse the (times, signal) data of a CSV waveform file
+
+    The whole trace is parsed into one preallocated array. With ``start``
+    and/or ``end`` only the samples between those times are kept, and
+    parsing stops at the first chunk after ``end`` (times increase down the
+    file), so memory use is bounded by the range rather than the file.
+    """
+    if start is None and end is None:
+        data = np.empty((2, count_rows(path)))
+        return data[:, :fill(path, data, chunk_rows)]
+    kept = []
+    for chunk in read_chunks(path, chunk_rows):
+        kept.append(crop(chunk, start, end).copy())
+        if end is not None and chunk[0, -1] > end:
+            break
+    return np.concatenate(kept, axis=1) if kept else np.empty((2, 0))
+
+
+def crop(data, start=None, end=None):
+    """return the samples of (times, signal) data from start to end
+
+    The result is a view, so cropping a memory mapped trace reads nothing.
+    """
+    times = data[0]
+    low = 0 if start is None else np.searchsorted(times, start, 'left')
+    high = len(times) if end is None else np.searchsorted(times, end, 'right')
+    return data[:, low:high]
+
+
+def file_identity(path):
+    """return a string naming the current contents of a file
+
+    It covers the absolute path, modification time and size of the file,
+    so an edited file never matches a stale entry.
+    """
+    stat = os.stat(path)
+    return '{}\0{}\0{}'.format(
+        os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def file_hash(path):
+    """return the SHA-1 digest of the contents of a file"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as datafile:
+        for block in iter(lambda: datafile.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_path(path, cache_dir):
+    """return the cache file for a waveform file (see ``file_identity``)"""
+    key = file_identity(path)
+    name = hashlib.sha1(key.encode('utf-8')).hexdigest() + '.npy'
+    return os.path.join(cache_dir, name)
+
+
+def load_trace(path, cache_dir=None, start=None, end=None):
+    """return the (times, signal) data of a waveform file
+
+    If a cache directory is given (or set in the ``POROPYCK_CACHE_DIR``
+    environment variable) parsed traces are stored there in ``.npy`` format
+    and later loads memory map the cached array instead of parsing the CSV.
+    A cache miss parses the file straight into the memory mapped cache file.
+    ``start`` and ``end`` limit the samples returned to a time range (see
+    ``read_csv``); the cache always holds the whole trace.
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get(CACHE_DIR_VARIABLE)
+    if not cache_dir:
+        return read_csv(path, start, end)
+    cached = cache_path(path, cache_dir)
+    try:
+        return crop(np.load(cached, mmap_mode='r'), start, end)
+    except (OSError, ValueError):
+        pass
+    os.makedirs(cache_dir, exist_ok=True)
+    # write under a private name first so concurrent loaders never see a
+    # partial file
+    partial = '{}.{}.tmp'.format(cached, os.getpid())
+    data = np.lib.format.open_memmap(
+        partial, mode='w+', dtype=float, shape=(2, count_rows(path)))
+    filled = fill(path, data)
+    if filled < data.shape[1]:
+        # blank lines were counted as rows, so save the samples found
+        trimmed = np.array(data[:, :filled])
+        del data
+        with open(partial, 'wb') as npyfile:
+            np.save(npyfile, trimmed)
+    else:
+        data.flush()
+        del data
+    os.replace(partial, cached)
+    return crop(np.load(cached, mmap_mode='r'), start, end)
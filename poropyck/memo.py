@@ -0,0 +1,140 @@
+"""Memoization of DTW alignments"""
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+DEFAULT_MAX_BYTES = 64 * 2**20
+
+
+def alignment_key(kind, template, query, dtw_options=None):
+    """return the memo key of an alignment
+
+    ``template`` and ``query`` are ``(identity, window)`` pairs, where the
+    identity names the source data (see ``poropyck.loader.file_identity``).
+    The DTW options are part of the key, as they change the path.
+    """
+    digest = hashlib.sha1()
+    _update(digest, (kind, template, query,
+                     sorted((dtw_options or {}).items())))
+    return digest.hexdigest()
+
+
+def _update(digest, value):
+    """add a value to a digest, hashing the contents of any arrays
+
+    ``repr`` abbreviates long arrays, such as a custom ``(lo, hi)`` window,
+    so arrays are hashed by shape, type and bytes instead.
+    """
+    if isinstance(value, (tuple, list)):
+        digest.update('{}{}('.format(type(value).__name__,
+                                     len(value)).encode('utf-8'))
+        for item in value:
+            _update(digest, item)
+        digest.update(b')')
+    elif isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        digest.update('array{}{}('.format(array.shape,
+                                          array.dtype.str).encode('utf-8'))
+        digest.update(array.tobytes())
+        digest.update(b')')
+    else:
+        digest.update('{!r},'.format(value).encode('utf-8'))
+
+
+class AlignmentCache:
+    """least recently used store of DTW paths
+
+    Paths are kept in memory up to ``max_bytes`` in total, dropping the
+    least recently used first. With a ``directory`` every path is also saved
+    there as a ``.npz`` file, so later sessions, and other processes, find
+    it. One cache can be shared by many sessions and threads; a pickled
+    copy (as sent to a worker process) starts empty but shares the
+    directory.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._paths = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __getstate__(self):
+        # worker processes get an empty cache sharing the same directory
+        return {'max_bytes': self.max_bytes, 'directory': self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def get(self, key):
+        """return the (indices1, indices2) path stored under a key, or None"""
+        with self._lock:
+            path = self._paths.get(key)
+            if path is not None:
+                self._paths.move_to_end(key)
+                self.hits += 1
+                return path
+        path = self._load(key)
+        with self._lock:
+            if path is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._remember(key, path)
+        return path
+
+    def put(self, key, path):
+        """store a path, saving it to the directory if there is one"""
+        path = tuple(np.asarray(indices) for indices in path)
+        with self._lock:
+            self._remember(key, path)
+        if self.directory:
+            self._save(key, path)
+
+    def clear(self):
+        """forget the paths held in memory (saved files are kept)"""
+        with self._lock:
+            self._paths.clear()
+            self.nbytes = 0
+
+    def _remember(self, key, path):
+        """hold a path in memory, dropping old ones to stay in budget"""
+        if key in self._paths:
+            self._paths.move_to_end(key)
+            return
+        self._paths[key] = path
+        self.nbytes += sum(indices.nbytes for indices in path)
+        while self.nbytes > self.max_bytes and self._paths:
+            _, dropped = self._paths.popitem(last=False)
+            self.nbytes -= sum(indices.nbytes for indices in dropped)
+
+    def _file(self, key):
+        """the file a path is saved in"""
+        return os.path.join(self.directory, key + '.npz')
+
+    def _load(self, key):
+        """read a saved path, or return None"""
+        if not self.directory:
+            return None
+        try:
+            with np.load(self._file(key)) as saved:
+                return saved['indices1'], saved['indices2']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save(self, key, path):
+        """write a path under a private name, then move it into place"""
+        os.makedirs(self.directory, exist_ok=True)
+        partial = '{}.{}.{}.tmp'.format(
+            self._file(key), os.getpid(), threading.get_ident())
+        with open(partial, 'wb') as npzfile:
+            np.savez(npzfile, indices1=path[0], indices2=path[1])
+        os.replace(partial, self._file(key))
@@ -1,11 +1,9 @@
 """Dynamic time warping"""
-import matplotlib.pyplot as plt
 import numpy as np
-from mpl_toolkits.mplot3d import Axes3D  # pylint: disable=unused-import
-from scipy.signal import hilbert
-from scipy.stats import norm
-import uncertainties
-from dtw import dtw  # pylint: disable=no-name-in-module
+
+from .decimate import MinMaxPyramid
+from .session import PickSession, load_range, load_timed
+from .timing import timed
 
 
 # colours
@@ -13,54 +11,74 @@ HIGHLIGHT_COLOR = 'thistle'
 ENVELOPE_COLOR = 'lightpink'
 ENVELOPE_ALPHA = 0.4
 PATH_COLOR = 'black'
-SKIP_ROWS_IN_CSV = 21
 
 
 class DTW:
-    """compare using dynamic time warping"""
+    """compare using dynamic time warping
+
+    This is the interactive view of a ``PickSession``, which holds all of
+    the numerical state. Pass a ``poropyck.timing.Timer`` as ``timer`` to
+    record how long loading, each computation and each redraw takes.
+    With a ``margin`` (in microseconds), a trace whose start and end are
+    both given is only loaded from ``margin`` before to ``margin`` after
+    them, which bounds the memory used by very long recordings. Initial
+    picks can be given as ``template_pick`` and ``query_pick``. With
+    ``incremental``, nudging a window edge only recomputes the part of the
+    signal DTW cost matrix that it changed, as long as the window peak is
+    unchanged; the envelope and phase, whose Hilbert transforms span the
+    whole window, are recomputed in full. Give an ``alignment_cache`` (a
+    ``poropyck.memo.AlignmentCache``) to reuse the paths of windows that
+    were aligned before. The three alignments run one after another unless
+    an ``executor`` (a process pool, as the kernel holds the GIL) is given;
+    see ``PickSession.alignments``.
+    """
 
     def __init__(self, template_path, query_path, length_data,
                  template_color='tan', template_start=None, template_end=None,
-                 query_color='blue', query_start=None, query_end=None):
+                 query_color='blue', query_start=None, query_end=None,
+                 cache_dir=None, dtw_options=None, executor=None,
+                 timer=None, margin=None, template_pick=None,
+                 query_pick=None, incremental=False, alignment_cache=None):
         self.fig = None
         self.ax = None
         self.template_path = template_path
         self.query_path = query_path
         self.template_color = template_color
         self.query_color = query_color
-        length_mean = np.mean(length_data)
-        length_std = np.std(length_data)
-        self.length = (
-            length_mean if length_std == 0.0
-            else uncertainties.ufloat(length_mean, length_std)
-        )
-        self.template = Signal(
-            np.loadtxt(template_path, delimiter=',',
-                       skiprows=SKIP_ROWS_IN_CSV).T[:2],
-            self.length,
-            color=template_color,
-            window_start=template_start,
-            window_end=template_end
-        )
-        self.query = Signal(
-            np.loadtxt(query_path, delimiter=',',
-                       skiprows=SKIP_ROWS_IN_CSV).T[:2],
-            self.length,
-            color=query_color,
-            window_start=query_start,
-            window_end=query_end
+        self.session = PickSession(
+            load_timed(template_path, cache_dir, timer,
+                       *load_range(template_start, template_end, margin)),
+            load_timed(query_path, cache_dir, timer,
+                       *load_range(query_start, query_end, margin)),
+            length_data,
+            template_start=template_start,
+            template_end=template_end,
+            query_start=query_start,
+            query_end=query_end,
+            dtw_options=dtw_options,
+            executor=executor,
+            template_path=template_path,
+            query_path=query_path,
+            timer=timer,
+            template_pick=template_pick,
+            query_pick=query_pick,
+            incremental=incremental,
+            alignment_cache=alignment_cache
         )
-        self.indices1 = None
-        self.indices1a = None
-        self.indices1h = None
-        self.indices2 = None
-        self.indices2a = None
-        self.indices2h = None
+        self.timer = self.session.timer
+        self.template = Signal(self.session, 'template', template_color)
+        self.query = Signal(self.session, 'query', query_color)
         self.summary_xlim = None
         self.summary_ylim = None
+        self.highlights = {}
+        self.details = {}
 
     def pick(self):
         """show plots and start the picking process"""
+        # pyplot is only needed for interactive picking, so headless users
+        # (see pick_auto) never pay for the GUI backend
+        import matplotlib.pyplot as plt
+        from mpl_toolkits.mplot3d import Axes3D  # pylint: disable=unused-import
         self.fig = plt.figure()
         self.ax = {
             'template': self.fig.add_axes([0.03, 0.865, 0.9, 0.1]),
@@ -110,74 +128,63 @@ class DTW:
         self.template.plot(self.ax['template'])
         self.query.plot(self.ax['query'])
         self.run_dtw()
+        self.plot_dtw(self.ax['dtw'])
+        self.plot_summary(self.ax['x'], self.ax['y'], self.ax['summary'])
         self.highlight_summary()
         self.plot_results()
         plt.show()
-        return {
-            'file': self.query_path,
-            'window_start': self.query.pick_start,
-            'window_end': self.query.pick_end,
-            'distance': get_mean(self.length),
-            'distance_error': get_std(self.length),
-            'time': get_mean(self.query.time),
-            'time_error': get_std(self.query.time),
-            'velocity': get_mean(self.query.velocity),
-            'velocity_error': get_std(self.query.velocity),
-            'template': {
-                'file': self.template_path,
-                'window_start': self.template.pick_start,
-                'window_end': self.template.pick_end,
-                'time': get_mean(self.template.time),
-                'time_error': get_std(self.template.time),
-                'velocity': get_mean(self.template.velocity),
-                'velocity_error': get_std(self.template.velocity)
-            }
-        }
+        return self.results()
+
+    def pick_auto(self):
+        """pick without user interaction
+
+        The template pick is the AIC-proposed arrival. It is carried across
+        to the query along the signal DTW path, just as clicking on the
+        summary curve would do, so the result does not depend on a display.
+        Returns the same dictionary as ``pick``.
+        """
+        return self.session.pick_auto()
+
+    def results(self):
+        """return the current picks as a dictionary"""
+        return self.session.results()
 
+    @timed('onpress')
     def onpress(self, event):
         """mouse button pressed"""
         if event.inaxes is self.ax['template'] or event.inaxes is self.ax['query']:
+            self.clear_output_axes()
             if event.inaxes is self.ax['template']:
                 self.template.onpress(event)
-                self.template.plot(self.ax['template'])
             if event.inaxes is self.ax['query']:
                 self.query.onpress(event)
-                self.query.plot(self.ax['query'])
-            if event.inaxes is self.ax['template']:
-                self.template.pick_start = None
-                self.template.pick_end = None
-            if event.inaxes is self.ax['query']:
-                self.query.pick_start = None
-                self.query.pick_end = None
-            self.clear_output_axes()
-            self.fig.canvas.draw_idle()
 
+    @timed('onrelease')
     def onrelease(self, event):
         """mouse button released"""
         if self.template.pressed or self.query.pressed:
             if self.template.pressed:
                 self.template.onrelease(event)
-                self.template.plot(self.ax['template'])
             if self.query.pressed:
                 self.query.onrelease(event)
-                self.query.plot(self.ax['query'])
             self.run_dtw()
+            self.plot_dtw(self.ax['dtw'])
+            self.plot_summary(self.ax['x'], self.ax['y'], self.ax['summary'])
             self.highlight_summary()
             self.plot_results()
             self.fig.canvas.draw_idle()
 
+    @timed('onmotion')
     def onmotion(self, event):
         """mouse moves"""
         if event.inaxes is self.ax['template'] or event.inaxes is self.ax['query']:
             if self.template.pressed or self.query.pressed:
                 if self.template.pressed:
-                    self.template.move_line(event)
-                    self.template.plot(self.ax['template'])
+                    self.template.drag(event)
                 if self.query.pressed:
-                    self.query.move_line(event)
-                    self.query.plot(self.ax['query'])
-                self.fig.canvas.draw_idle()
+                    self.query.drag(event)
 
+    @timed('onpick')
     def onpick(self, event):
         """pick values from the active plot"""
         indices = event.ind
@@ -189,28 +196,25 @@ class DTW:
         xpoint = xdata[np.argmin(dists)]
         ypoint = ydata[np.argmin(dists)]
 
-        if self.template.pick_start is None or self.query.pick_start is None:
-            self.template.pick_start = ypoint
-            self.query.pick_start = xpoint
-        elif self.template.pick_end is None or self.query.pick_end is None:
-            self.template.pick_end = ypoint
-            self.query.pick_end = xpoint
+        template_start, template_end = self.session.picks('template')
+        query_start, query_end = self.session.picks('query')
+        if template_start is None or query_start is None:
+            template_start, query_start = ypoint, xpoint
+        elif template_end is None or query_end is None:
+            template_end, query_end = ypoint, xpoint
         else:
             dist_to_start = np.sqrt(
-                (xpoint - self.query.pick_start)**2 +
-                (ypoint - self.template.pick_start)**2
+                (xpoint - query_start)**2 + (ypoint - template_start)**2
             )
             dist_to_end = np.sqrt(
-                (xpoint - self.query.pick_end)**2 +
-                (ypoint - self.template.pick_end)**2
+                (xpoint - query_end)**2 + (ypoint - template_end)**2
             )
             if dist_to_start <= dist_to_end:
-                self.template.pick_start = ypoint
-                self.query.pick_start = xpoint
+                template_start, query_start = ypoint, xpoint
             else:
-                self.template.pick_end = ypoint
-                self.query.pick_end = xpoint
-        self.plot_summary(self.ax['x'], self.ax['y'], self.ax['summary'])
+                template_end, query_end = ypoint, xpoint
+        self.session.set_picks('template', template_start, template_end)
+        self.session.set_picks('query', query_start, query_end)
         self.highlight_summary()
         self.plot_results()
         self.fig.canvas.draw_idle()
@@ -223,46 +227,42 @@ class DTW:
         """summary axes is zoomed - y"""
         self.summary_ylim = axes.get_ylim()
 
+    @timed('run_dtw')
     def run_dtw(self):
-        """run dynamic time warping"""
-        self.indices1, self.indices2 = dtw(
-            self.query.picked_signal, self.template.picked_signal)[1:3]
-        self.indices1h, self.indices2h = dtw(
-            self.query.hilbert_abs(), self.template.hilbert_abs())[1:3]
-        self.indices1a, self.indices2a = dtw(
-            self.query.hilbert_angle(), self.template.hilbert_angle())[1:3]
+        """run dynamic time warping
 
-        self.plot_dtw(self.ax['dtw'])
-        self.plot_summary(self.ax['x'], self.ax['y'], self.ax['summary'])
+        Only alignments whose windows changed are recomputed (see
+        ``PickSession.alignments``).
+        """
+        self.session.alignments()
 
+    @timed('plot_dtw')
     def plot_dtw(self, ax):
         """plot the 3D DTW data"""
-        template_times = self.template.picked_times
-        template_signal = self.template.picked_signal
-        query_times = self.query.picked_times
-        query_signal = self.query.picked_signal
+        template_times, template_signal = self.session.picked('template')
+        query_times, query_signal = self.session.picked('query')
+        indices1, indices2 = self.session.alignment('signal')
         ax.clear()
         ax.set_title('Dynamic Time Warping Visualization', y=1.15)
         ax.plot(template_times, template_signal, zs=1, c=self.template.color)
         ax.plot(query_times, query_signal, zs=0, c=self.query.color)
-        for i in np.arange(0, len(self.indices1) - 1, 20):
-            x_start = np.take(template_times, self.indices2[i].astype(int) - 1)
-            x_end = np.take(query_times, self.indices1[i].astype(int) - 1)
-            y_start = np.take(
-                template_signal, self.indices2[i].astype(int) - 1)
-            y_end = np.take(query_signal, self.indices1[i].astype(int) - 1)
+        for i in np.arange(0, len(indices1) - 1, 20):
+            x_start = np.take(template_times, indices2[i].astype(int) - 1)
+            x_end = np.take(query_times, indices1[i].astype(int) - 1)
+            y_start = np.take(template_signal, indices2[i].astype(int) - 1)
+            y_end = np.take(query_signal, indices1[i].astype(int) - 1)
             ax.plot(
                 [x_start, x_end], [y_start, y_end],
                 '-', color=HIGHLIGHT_COLOR, lw=0.5, zs=[1, 0]
             )
-        self.summary_xlim = (self.query.start, self.query.finish)
-        self.summary_ylim = (self.template.start, self.template.finish)
+        self.summary_xlim = self.session.window('query')
+        self.summary_ylim = self.session.window('template')
 
+    @timed('plot_summary')
     def plot_summary(self, x_ax, y_ax, summary_ax):
         """plot the time warping summary"""
-        query_times = self.query.picked_times
-        query_signal = self.query.picked_signal
-        queryh = self.query.hilbert_abs()
+        query_times, query_signal = self.session.picked('query')
+        queryh = self.session.envelope('query')
         x_ax.clear()
         x_ax.set_title(
             ('Use predicted arrival shown or\n' +
@@ -270,9 +270,13 @@ class DTW:
              'Close window when complete.'),
             y=1.25
         )
-        x_ax.plot(query_times, query_signal, '-', c=self.query_color, lw=2)
-        x_ax.fill_between(query_times, queryh, -queryh,
-                          color=ENVELOPE_COLOR, alpha=ENVELOPE_ALPHA)
+        # keep references, as the axes only hold weak ones to the callbacks
+        self.details = {}
+        self.details['x'] = DetailedTrace(
+            x_ax, query_times, query_signal, queryh,
+            line={'ls': '-', 'c': self.query_color, 'lw': 2},
+            fill={'color': ENVELOPE_COLOR, 'alpha': ENVELOPE_ALPHA}
+        )
         try:
             x_ax.set_ylim(1.1 * np.min(query_signal),
                           1.1 * np.max(queryh))
@@ -281,13 +285,14 @@ class DTW:
         x_ax.grid(True, axis='x', color='lightgrey')
         x_ax.tick_params(axis='x', which='major')
 
-        template_times = self.template.picked_times
-        template_signal = self.template.picked_signal
-        templateh = self.template.hilbert_abs()
+        template_times, template_signal = self.session.picked('template')
+        templateh = self.session.envelope('template')
         y_ax.clear()
-        y_ax.plot(template_signal, template_times, c=self.template_color, lw=2)
-        y_ax.fill_betweenx(template_times, templateh, -templateh,
-                           color=ENVELOPE_COLOR, alpha=ENVELOPE_ALPHA)
+        self.details['y'] = DetailedTrace(
+            y_ax, template_times, template_signal, templateh, vertical=True,
+            line={'c': self.template_color, 'lw': 2},
+            fill={'color': ENVELOPE_COLOR, 'alpha': ENVELOPE_ALPHA}
+        )
         try:
             y_ax.set_xlim(1.1 * np.min(template_signal),
                           1.1 * np.max(templateh))
@@ -297,13 +302,15 @@ class DTW:
         y_ax.tick_params(axis='y', which='major')
         y_ax.invert_xaxis()
 
-        end = len(self.indices1)
-        idxto = np.take(template_times, self.indices2[:end].astype(int) - 1)
-        idxqo = np.take(query_times, self.indices1.astype(int) - 1)
+        indices1, indices2 = self.session.alignment('signal')
+        end = len(indices1)
+        idxto = np.take(template_times, indices2[:end].astype(int) - 1)
+        idxqo = np.take(query_times, indices1.astype(int) - 1)
 
-        end = len(self.indices1h)
-        idxtoh = np.take(template_times, self.indices2h[:end].astype(int) - 1)
-        idxqoh = np.take(query_times, self.indices1h.astype(int) - 1)
+        indices1h, indices2h = self.session.alignment('envelope')
+        end = len(indices1h)
+        idxtoh = np.take(template_times, indices2h[:end].astype(int) - 1)
+        idxqoh = np.take(query_times, indices1h.astype(int) - 1)
 
         summary_ax.clear()
         summary_ax.fill_between(idxqoh, idxtoh, idxqoh,
@@ -314,7 +321,8 @@ class DTW:
         summary_ax.plot(idxqo, idxto, c=self.query_color, alpha=0.25, lw=2)
 
         times = np.linspace(
-            0, np.max([self.template.times, self.query.times]), 10)
+            0, np.max([self.session.data['template'][0],
+                       self.session.data['query'][0]]), 10)
         summary_ax.plot(times, times, color=HIGHLIGHT_COLOR, lw=1)
         summary_ax.tick_params(axis='both', which='major')
         summary_ax.grid(color='lightgrey')
@@ -332,28 +340,34 @@ class DTW:
             max(summary_ax.get_xlim()[1], summary_ax.get_ylim()[1])
         )
 
+    @timed('highlight_summary')
     def highlight_summary(self):
-        """highlight summary plot after points are picked"""
-        ax = self.ax['summary']
-        ax_x = self.ax['x']
-        ax_y = self.ax['y']
-
-        mean, std = self.query.time_picks()
-        min_ = mean - 2 * std
-        max_ = mean + 2 * std
-        ax.axvspan(min_, max_, alpha=0.4, color=self.query.color)
-        ax.axvline(mean, linewidth=2, color=self.query.color)
-        ax_x.axvspan(min_, max_, alpha=0.4, color=self.query.color)
-        ax_x.axvline(mean, linewidth=2, color=self.query.color)
-
-        mean, std = self.template.time_picks()
-        min_ = mean - 2 * std
-        max_ = mean + 2 * std
-        ax.axhspan(min_, max_, alpha=0.4, color=self.template.color)
-        ax.axhline(mean, linewidth=2, color=self.template.color)
-        ax_y.axhspan(min_, max_, alpha=0.4, color=self.template.color)
-        ax_y.axhline(mean, linewidth=2, color=self.template.color)
-
+        """highlight summary plot after points are picked
+
+        The highlights are created once per summary plot and then moved, so
+        picking does not rebuild the summary axes.
+        """
+        for signal, vertical, axes in [
+                (self.query, True, ('summary', 'x')),
+                (self.template, False, ('summary', 'y'))]:
+            mean, std = self.session.time_picks(signal.name)
+            for name in axes:
+                ax = self.ax[name]
+                band, line = self.highlights.get((signal.name, name),
+                                                 (None, None))
+                if not attached(line, ax):
+                    band = add_band(ax, vertical, alpha=0.4,
+                                    color=signal.color)
+                    line = (ax.axvline if vertical else ax.axhline)(
+                        mean, linewidth=2, color=signal.color)
+                    self.highlights[(signal.name, name)] = band, line
+                move_band(band, vertical, mean - 2 * std, mean + 2 * std)
+                if vertical:
+                    line.set_xdata([mean, mean])
+                else:
+                    line.set_ydata([mean, mean])
+
+    @timed('plot_results')
     def plot_results(self):
         """plot the distributions"""
         self.template.plot_time(self.ax['template_clicks'])
@@ -373,149 +387,236 @@ class DTW:
         self.ax['query_velocity'].clear()
 
 
-def aic(signal):
-    """estimate pick point"""
-    length = len(signal)
-    output = [0]
-    with np.errstate(divide='ignore'):
-        for k in range(1, length - 1):
-            val = (k * np.log(np.var(signal[0:k])) +
-                   (length-k-1) * np.log(np.var(signal[k+1:length])))
-            if val == -np.inf:
-                val = 0
-            output.append(val)
-    output.append(0)
-    return np.argmin(output)
-
-
 class Signal:
-    """one signal to be compared"""
+    """display and mouse controls of one trace of a pick session"""
 
-    def __init__(self, data, length, color='blue', window_start=None, window_end=None):
-        self.times, self.signal = data
-        self.length = length
+    def __init__(self, session, name, color='blue'):
+        self.session = session
+        self.timer = session.timer
+        self.name = name
         self.color = color
-        self.start = window_start
-        self.finish = window_end
-        width = len(self.signal) // 80
-        predicted = aic(self.signal)
-        if not self.start:
-            self.start = self.times[
-                max(0, predicted - width)
-            ]
-        if not self.finish:
-            self.finish = self.times[
-                min(len(self.signal) - 1, predicted + width)
-            ]
         self.pressed = False
-        self.pick_start = self.times[predicted]
-        self.pick_end = None
-        self.picked_times, self.picked_signal = self.get_picked_data()
-        self.velocity = None
-        self.time = None
+        self.span = None
+        self.trace = None
+        self.time_line = None
+        self.velocity_line = None
+        self.background = None
 
     def onpress(self, event):
-        """mouse button pressed"""
+        """mouse button pressed
+
+        While dragging, only the window span is redrawn, blitted over a
+        cached background of the rest of the figure.
+        """
         self.pressed = True
         self.move_line(event)
+        self.session.set_picks(self.name, None)
+        self.plot(event.inaxes)
+        canvas = event.inaxes.figure.canvas
+        if getattr(canvas, 'supports_blit', False):
+            self.span.set_animated(True)
+            canvas.draw()
+            self.background = canvas.copy_from_bbox(event.inaxes.bbox)
+        self.blit()
+
+    @timed('drag')
+    def drag(self, event):
+        """mouse moved while the button is pressed"""
+        self.move_line(event)
+        self.plot(self.span.axes)
+        self.blit()
+
+    @timed('blit')
+    def blit(self):
+        """redraw the window span"""
+        ax = self.span.axes
+        if self.background is None:
+            ax.figure.canvas.draw_idle()
+            return
+        ax.figure.canvas.restore_region(self.background)
+        ax.draw_artist(self.span)
+        ax.figure.canvas.blit(ax.bbox)
 
     def onrelease(self, event):
-        """mouse button released"""
+        """mouse button released
+
+        Moving the window resets the pick to the AIC proposal inside it.
+        """
         self.pressed = False
         self.move_line(event)
-        self.picked_times, self.picked_signal = self.get_picked_data()
-        predicted = aic(self.picked_signal)
-        self.pick_start = self.picked_times[predicted]
-        self.pick_end = None
+        self.span.set_animated(False)
+        self.background = None
+        self.plot(self.span.axes)
 
     def move_line(self, event):
         """move the nearest line"""
         click = event.xdata
-        if abs(click - self.start) < abs(click - self.finish):
-            self.start = click
+        start, finish = self.session.window(self.name)
+        if abs(click - start) < abs(click - finish):
+            start = click
         else:
-            self.finish = click
-
-    def get_picked_data(self):
-        """return picked data"""
-        pick = np.logical_and(self.start <= self.times,
-                              self.times <= self.finish)
-        times = np.extract(pick, self.times)
-        signal = np.extract(pick, self.signal)
-        absmax = np.max(np.abs(signal))
-        return times, signal / absmax
+            finish = click
+        self.session.set_window(self.name, start, finish)
 
     def plot(self, ax):
-        """plot the signal over time"""
-        title = ax.get_title()
-        ax.clear()
-        ax.set_title(title)
-        ax.axvspan(self.start, self.finish, alpha=0.4, color=self.color)
-        ax.plot(self.times, self.signal, color=self.color)
+        """plot the signal over time
+
+        The artists are created on the first call and only moved after.
+        """
+        start, finish = self.session.window(self.name)
+        if not attached(self.span, ax):
+            times, signal = self.session.data[self.name]
+            self.span = add_band(ax, True, alpha=0.4, color=self.color)
+            ax.update_datalim([(times[0], np.min(signal)),
+                               (times[-1], np.max(signal))])
+            ax.autoscale_view()
+            self.trace = DetailedTrace(
+                ax, times, signal, line={'color': self.color})
+        move_band(self.span, True, start, finish)
 
     def plot_time(self, ax):
         """plot time distribution"""
-        ax.clear()
-        ax.set_title('time picks')
-        mean, std = self.time_picks()
+        # scipy.stats is slow to import and only needed for display
+        from scipy.stats import norm
+        if not attached(self.time_line, ax):
+            self.time_line = add_line(ax, ls='--', c=self.color, lw=2)
+            ax.set_xlabel(r'$\mu$s')
+        mean, std = self.session.time_picks(self.name)
         ax.set_title('Time\n{:5g}'.format(mean))
+        self.time_line.set_data([], [])
         if std != 0.0:
             range_ = np.linspace(mean - 2 * std, mean + 2 * std, 50)
             norm_ = norm.pdf(range_, mean, std)
-            ax.plot(range_, norm_, '--', c=self.color, lw=2)
+            self.time_line.set_data(range_, norm_)
             ax.set_title('Time\n{:5g}±{:5g}'.format(mean, std))
-        ax.set_xlabel(r'$\mu$s')
+            ax.relim()
+            ax.autoscale_view()
 
     def plot_velocity(self, ax):
         """plot velocity distribution"""
-        time_mean, time_std = self.time_picks()
-        self.time = (
-            time_mean if time_std == 0.0
-            else uncertainties.ufloat(time_mean, time_std)
-        )
-        self.velocity = (self.length / self.time) * 1e4
-        ax.clear()
-        plt.sca(ax)
-        if isinstance(self.velocity, float):
-            ax.set_title('Velocity\n{:5g}'.format(self.velocity))
+        from scipy.stats import norm
+        if not attached(self.velocity_line, ax):
+            self.velocity_line = add_line(ax, color=self.color, lw=2,
+                                          ls='dashed')
+            ax.set_xlabel('m/s')
+        velocity = self.session.velocity(self.name)
+        self.velocity_line.set_data([], [])
+        if isinstance(velocity, float):
+            ax.set_title('Velocity\n{:5g}'.format(velocity))
         else:
             x = np.linspace(
-                norm.ppf(0.01, self.velocity.n, self.velocity.s),
-                norm.ppf(0.99, self.velocity.n, self.velocity.s),
+                norm.ppf(0.01, velocity.n, velocity.s),
+                norm.ppf(0.99, velocity.n, velocity.s),
                 1000
             )
-            ax.plot(x, norm.pdf(x, self.velocity.n, self.velocity.s),
-                    color=self.color, lw=2, ls='dashed')
+            self.velocity_line.set_data(
+                x, norm.pdf(x, velocity.n, velocity.s))
             ax.set_title('Velocity\n{:5g}±{:5g}'.format(
-                self.velocity.n, self.velocity.s))
-        ax.set_xlabel('m/s')
-
-    def hilbert_angle(self):
-        """get the angle of the hilbert transform"""
-        return np.angle(hilbert(self.picked_signal)) / np.pi
-
-    def hilbert_abs(self):
-        """get the absolute value of the hilbert transform"""
-        return np.abs(hilbert(self.picked_signal))
-
-    def time_picks(self):
-        """return picked time data"""
-        if self.pick_start:
-            if self.pick_end:
-                two_std = abs(self.pick_end - self.pick_start) / 2
-                mean = min(self.pick_start, self.pick_end) + two_std
-                return mean, two_std / 2
-            return self.pick_start, 0.0
-        return 0.0, 0.0
-
-
-def get_mean(x):
-    if isinstance(x, float):
-        return x
-    return x.n
-
-
-def get_std(x):
-    if isinstance(x, float):
-        return 0.0
-    return x.s
+                velocity.n, velocity.s))
+            ax.relim()
+            ax.autoscale_view()
+
+
+class DetailedTrace:
+    """a trace, and optionally its envelope, drawn at the detail of the axes
+
+    Min/max pyramids are built once. Each time the time axis is zoomed the
+    level matching the axes size in pixels is drawn instead of every
+    sample. With ``vertical`` the time axis is the y axis.
+    """
+
+    def __init__(self, ax, times, signal, envelope=None, vertical=False,
+                 line=None, fill=None):
+        self.times = times
+        self.signal = signal
+        self.envelope = envelope
+        self.vertical = vertical
+        self.pyramid = MinMaxPyramid(times, signal)
+        self.envelope_pyramid = (
+            None if envelope is None else MinMaxPyramid(times, envelope))
+        self.line = add_line(ax, **(line or {}))
+        self.fill_kwargs = fill or {}
+        self.fill = None
+        self.cid = ax.callbacks.connect(
+            'ylim_changed' if vertical else 'xlim_changed', self.refresh)
+        self.refresh(ax)
+
+    def refresh(self, ax):
+        """draw the samples needed at the current limits"""
+        if not attached(self.line, ax):
+            ax.callbacks.disconnect(self.cid)
+            return
+        if self.vertical:
+            start, stop = sorted(ax.get_ylim())
+            pixels = ax.bbox.height
+        else:
+            start, stop = sorted(ax.get_xlim())
+            pixels = ax.bbox.width
+        pixels = max(int(pixels), 1)
+        indices = self.pyramid.select(start, stop, pixels)
+        times, signal = self.times[indices], self.signal[indices]
+        if self.vertical:
+            self.line.set_data(signal, times)
+        else:
+            self.line.set_data(times, signal)
+        if self.envelope_pyramid is not None:
+            indices = self.envelope_pyramid.select(start, stop, pixels)
+            times, envelope = self.times[indices], self.envelope[indices]
+            if attached(self.fill, ax):
+                self.fill.remove()
+            fill = ax.fill_betweenx if self.vertical else ax.fill_between
+            self.fill = fill(times, envelope, -envelope, **self.fill_kwargs)
+
+
+def attached(artist, ax):
+    """whether an artist is still on an axes (clearing the axes drops it)"""
+    return artist is not None and artist in ax.get_children()
+
+
+def add_line(ax, **kwargs):
+    """add an empty line, to be filled in later, without rescaling the axes"""
+    from matplotlib.lines import Line2D
+    return ax.add_line(Line2D([], [], **kwargs))
+
+
+def add_band(ax, vertical, **kwargs):
+    """add a band spanning the axes, across x (vertical) or y, to be moved"""
+    from matplotlib.patches import Rectangle
+    if vertical:
+        band = Rectangle((0, 0), 0, 1, transform=ax.get_xaxis_transform(),
+                         **kwargs)
+    else:
+        band = Rectangle((0, 0), 1, 0, transform=ax.get_yaxis_transform(),
+                         **kwargs)
+    ax.add_patch(band)
+    return band
+
+
+def move_band(band, vertical, low, high):
+    """move a band made by add_band to cover low to high"""
+    if vertical:
+        band.set_x(low)
+        band.set_width(high - low)
+    else:
+        band.set_y(low)
+        band.set_height(high - low)
+
+
+def pick_batch(pairs, length_data, **kwargs):
+    """pick many (template, query) pairs without user interaction
+
+    Each pair is either a ``(template_path, query_path)`` tuple or a
+    dictionary of ``DTW`` keyword arguments (for example to supply windows).
+    Any extra keyword arguments are passed to every ``DTW``. Returns a list
+    of ``DTW.pick_auto`` results in the order of the pairs.
+    """
+    results = []
+    for pair in pairs:
+        if isinstance(pair, dict):
+            options = dict(kwargs, **pair)
+        else:
+            template_path, query_path = pair
+            options = dict(kwargs, template_path=template_path,
+                           query_path=query_path)
+        results.append(DTW(length_data=length_data, **options).pick_auto())
+    return results
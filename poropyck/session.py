@@ -0,0 +1,454 @@
+"""Pick state of a template/query comparison, independent of any display
+
+A ``PickSession`` owns the traces, windows, picks, DTW paths and velocity
+results of one comparison. Derived quantities are computed when first asked
+for and then cached. Changing an input (a window or the picks) marks only
+the quantities that depend on it as dirty, following ``DEPENDENCIES``, so
+only those are recomputed.
+"""
+import hashlib
+import time
+
+import numpy as np
+import uncertainties
+
+from .loader import file_identity, load_trace
+from .memo import alignment_key
+from .onset import aic, propose_windows
+from .spectral import hilbert
+from .timing import Timer
+from .warping import IncrementalDTW, dtw, estimate_lag
+
+TRACES = ('template', 'query')
+ALIGNMENTS = ('signal', 'envelope', 'phase')
+
+# each quantity and the quantities it is computed from
+DEPENDENCIES = {
+    ('template', 'window'): (),
+    ('template', 'picked'): (('template', 'window'),),
+    ('template', 'analytic'): (('template', 'picked'),),
+    ('template', 'picks'): (('template', 'picked'),),
+    ('template', 'velocity'): (('template', 'picks'),),
+    ('query', 'window'): (),
+    ('query', 'picked'): (('query', 'window'),),
+    ('query', 'analytic'): (('query', 'picked'),),
+    ('query', 'picks'): (('query', 'picked'),),
+    ('query', 'velocity'): (('query', 'picks'),),
+    ('alignment', 'signal'): (('template', 'picked'), ('query', 'picked')),
+    ('alignment', 'envelope'): (('template', 'analytic'),
+                                ('query', 'analytic')),
+    ('alignment', 'phase'): (('template', 'analytic'), ('query', 'analytic')),
+}
+
+DEPENDENTS = {node: tuple(child for child, parents in DEPENDENCIES.items()
+                          if node in parents)
+              for node in DEPENDENCIES}
+
+# the timer stage of each computed quantity
+STAGES = {'picked': 'window', 'analytic': 'hilbert', 'picks': 'aic',
+          'velocity': 'velocity'}
+
+
+class PickSession:
+    """traces, windows, alignments and picks of one comparison
+
+    ``template_data`` and ``query_data`` are ``(times, signal)`` arrays.
+    Windows default to the AIC-proposed arrival of each full trace, which is
+    also the initial pick. A trace given its window and initial pick (for
+    example from ``poropyck.onset.propose_windows``) skips the proposal.
+    ``dtw_options`` are passed to ``poropyck.warping.dtw`` and the
+    alignments run on ``executor`` (see ``alignments``). Stages are
+    recorded on ``timer`` (a ``poropyck.timing.Timer``) if given. With
+    ``incremental``, each alignment keeps its cost matrix and reuses the
+    part before the first changed sample (see
+    ``poropyck.warping.IncrementalDTW``). In practice only the signal
+    alignment gains, while the window peak is unchanged.
+    Paths are looked up in, and added to, ``alignment_cache`` (a
+    ``poropyck.memo.AlignmentCache``) if given.
+    """
+
+    def __init__(self, template_data, query_data, length_data,
+                 template_start=None, template_end=None,
+                 query_start=None, query_end=None,
+                 dtw_options=None, executor=None,
+                 template_path=None, query_path=None, timer=None,
+                 template_pick=None, query_pick=None, incremental=False,
+                 alignment_cache=None):
+        self.timer = timer or Timer(enabled=False)
+        self.data = {'template': template_data, 'query': query_data}
+        self.paths = {'template': template_path, 'query': query_path}
+        self.alignment_cache = alignment_cache
+        self._identities = {}
+        self.dtw_options = dtw_options or {}
+        self.executor = executor
+        self.incremental = (
+            {kind: IncrementalDTW(**self.dtw_options) for kind in ALIGNMENTS}
+            if incremental else None
+        )
+        length_mean = np.mean(length_data)
+        length_std = np.std(length_data)
+        self.length = (
+            length_mean if length_std == 0.0
+            else uncertainties.ufloat(length_mean, length_std)
+        )
+        self._values = {}
+        self._dirty = set(DEPENDENCIES)
+        self._propose('template', template_start, template_end, template_pick)
+        self._propose('query', query_start, query_end, query_pick)
+
+    @classmethod
+    def from_files(cls, template_path, query_path, length_data,
+                   cache_dir=None, timer=None, margin=None, **kwargs):
+        """start a session from two waveform files
+
+        With a ``margin``, a trace whose window is given is only loaded from
+        ``margin`` before the window to ``margin`` after it (see
+        ``load_range``).
+        """
+        return cls(
+            load_timed(template_path, cache_dir, timer, *load_range(
+                kwargs.get('template_start'), kwargs.get('template_end'),
+                margin)),
+            load_timed(query_path, cache_dir, timer, *load_range(
+                kwargs.get('query_start'), kwargs.get('query_end'), margin)),
+            length_data,
+            template_path=template_path,
+            query_path=query_path,
+            timer=timer,
+            **kwargs
+        )
+
+    def _propose(self, trace, start, finish, pick):
+        """set the default window and pick of a trace"""
+        if not (start and finish and pick):
+            with self.timer.stage('aic', len(self.data[trace][1])):
+                proposal = propose_windows([self.data[trace]])
+            start = start or proposal['window_start'][0]
+            finish = finish or proposal['window_end'][0]
+            pick = pick or proposal['pick'][0]
+        self.set_window(trace, start, finish)
+        self.set_picks(trace, pick)
+
+    def _set(self, node, value):
+        """store an input value and mark everything depending on it dirty"""
+        self._values[node] = value
+        self._dirty.discard(node)
+        self._invalidate(node)
+
+    def _invalidate(self, node):
+        """mark the dependents of a node dirty
+
+        The whole subgraph is walked, because a value set directly (such as
+        the picks) can be clean while the values it normally depends on are
+        dirty.
+        """
+        for child in DEPENDENTS[node]:
+            self._dirty.add(child)
+            self._invalidate(child)
+
+    def _get(self, node):
+        """return a value, computing it first if it is dirty
+
+        The values it depends on are brought up to date first, so each stage
+        is timed on its own.
+        """
+        if node in self._dirty:
+            for parent in DEPENDENCIES[node]:
+                self._get(parent)
+            owner, quantity = node
+            if owner == 'alignment':
+                value = self._align(quantity)
+            else:
+                size = None
+                if quantity == 'picked':
+                    size = len(self.data[owner][0])
+                elif quantity in ('analytic', 'picks'):
+                    size = len(self._values[(owner, 'picked')][0])
+                with self.timer.stage(STAGES[quantity], size):
+                    value = getattr(self, '_compute_' + quantity)(owner)
+            self._values[node] = value
+            self._dirty.discard(node)
+        return self._values[node]
+
+    def is_dirty(self, trace, quantity):
+        """whether a quantity will be recomputed when next asked for"""
+        return (trace, quantity) in self._dirty
+
+    def window(self, trace):
+        """return the (start, finish) window of a trace"""
+        return self._values[(trace, 'window')]
+
+    def set_window(self, trace, start, finish):
+        """move the window of a trace
+
+        This resets the picks of the trace to the AIC proposal inside the
+        new window.
+        """
+        self._set((trace, 'window'), (start, finish))
+
+    def picks(self, trace):
+        """return the (pick_start, pick_end) times of a trace"""
+        return self._get((trace, 'picks'))
+
+    def set_picks(self, trace, pick_start, pick_end=None):
+        """set the picks of a trace"""
+        self._set((trace, 'picks'), (pick_start, pick_end))
+
+    def picked(self, trace):
+        """return the times and normalised signal inside the window"""
+        return self._get((trace, 'picked'))
+
+    def envelope(self, trace):
+        """return the absolute value of the hilbert transform"""
+        return self._get((trace, 'analytic'))[0]
+
+    def phase(self, trace):
+        """return the angle of the hilbert transform"""
+        return self._get((trace, 'analytic'))[1]
+
+    def time_picks(self, trace):
+        """return picked time data"""
+        pick_start, pick_end = self.picks(trace)
+        if pick_start:
+            if pick_end:
+                two_std = abs(pick_end - pick_start) / 2
+                mean = min(pick_start, pick_end) + two_std
+                return mean, two_std / 2
+            return pick_start, 0.0
+        return 0.0, 0.0
+
+    def time(self, trace):
+        """return the picked time, with uncertainty"""
+        return self._get((trace, 'velocity'))[0]
+
+    def velocity(self, trace):
+        """return the velocity, with uncertainty"""
+        return self._get((trace, 'velocity'))[1]
+
+    def alignment(self, kind):
+        """return the (indices1, indices2) DTW path of an alignment kind"""
+        return self._get(('alignment', kind))
+
+    def lag(self, kind='signal'):
+        """return the (lag, confidence) of the series of an alignment kind
+
+        The lag is the bulk shift, in samples, of the query window against
+        the template window found by cross-correlation (see
+        ``poropyck.warping.estimate_lag``). The ``'xcorr'`` DTW window is
+        centred on it.
+        """
+        return estimate_lag(*self._series(kind))
+
+    def alignments(self):
+        """return all DTW paths, computing the dirty ones concurrently
+
+        The signal, envelope and phase alignments are independent, so given
+        an ``executor`` they run on it and are joined before returning. The
+        DTW kernel holds the GIL, so only a process pool gains from this;
+        like any process pool, it needs the calling script to guard its
+        work with ``if __name__ == '__main__':`` wherever processes are
+        spawned (the default on macOS and Windows). Without an executor,
+        and for incremental alignments, whose cost matrices live in this
+        process, the alignments run one after another.
+        """
+        dirty = []
+        for kind in ALIGNMENTS:
+            if ('alignment', kind) in self._dirty:
+                path = self._recall(kind)
+                if path is None:
+                    dirty.append(kind)
+                else:
+                    self._values[('alignment', kind)] = path
+                    self._dirty.discard(('alignment', kind))
+        if self.executor is None or self.incremental:
+            for kind in dirty:
+                self._store(kind, self._dtw(kind, *self._series(kind)))
+            return {kind: self.alignment(kind) for kind in ALIGNMENTS}
+        # submit a module function, as the session itself cannot be pickled
+        futures = {kind: self.executor.submit(
+                       align_series, *self._series(kind), self.dtw_options)
+                   for kind in dirty}
+        for kind, future in futures.items():
+            path, seconds = future.result()
+            query, template = self._series(kind)
+            self.timer.record('dtw_' + kind, seconds,
+                              len(query) * len(template))
+            self._store(kind, path)
+        return {kind: self.alignment(kind) for kind in ALIGNMENTS}
+
+    def pick_auto(self):
+        """pick without user interaction
+
+        The template pick is kept (by default the AIC-proposed arrival) and
+        carried across to the query along the signal DTW path, just as
+        clicking on the summary curve would do.
+        """
+        self.alignments()
+        indices1, indices2 = self.alignment('signal')
+        template_times = np.take(
+            self.picked('template')[0], indices2.astype(int) - 1)
+        query_times = np.take(
+            self.picked('query')[0], indices1.astype(int) - 1)
+        nearest = np.argmin(
+            np.abs(template_times - self.time_picks('template')[0]))
+        self.set_picks('template', template_times[nearest])
+        self.set_picks('query', query_times[nearest])
+        return self.results()
+
+    def results(self):
+        """return the current picks as a dictionary"""
+        return {
+            'file': self.paths['query'],
+            'window_start': self.picks('query')[0],
+            'window_end': self.picks('query')[1],
+            'distance': get_mean(self.length),
+            'distance_error': get_std(self.length),
+            'time': get_mean(self.time('query')),
+            'time_error': get_std(self.time('query')),
+            'velocity': get_mean(self.velocity('query')),
+            'velocity_error': get_std(self.velocity('query')),
+            'template': {
+                'file': self.paths['template'],
+                'window_start': self.picks('template')[0],
+                'window_end': self.picks('template')[1],
+                'time': get_mean(self.time('template')),
+                'time_error': get_std(self.time('template')),
+                'velocity': get_mean(self.velocity('template')),
+                'velocity_error': get_std(self.velocity('template'))
+            }
+        }
+
+    def _series(self, kind):
+        """return the (query, template) series compared by an alignment"""
+        if kind == 'signal':
+            return self.picked('query')[1], self.picked('template')[1]
+        if kind == 'envelope':
+            return self.envelope('query'), self.envelope('template')
+        return self.phase('query'), self.phase('template')
+
+    def _store(self, kind, path):
+        """keep, and memoize, a newly computed DTW path"""
+        self._values[('alignment', kind)] = path
+        self._dirty.discard(('alignment', kind))
+        self._memoize(kind, path)
+
+    def _align(self, kind):
+        """compute one DTW path, unless it is memoized"""
+        path = self._recall(kind)
+        if path is None:
+            path = self._dtw(kind, *self._series(kind))
+            self._memoize(kind, path)
+        return path
+
+    def _identity(self, trace):
+        """return a string naming the source data of a trace"""
+        if trace not in self._identities:
+            try:
+                identity = file_identity(self.paths[trace])
+            except (OSError, TypeError):
+                identity = hashlib.sha1(np.ascontiguousarray(
+                    self.data[trace]).tobytes()).hexdigest()
+            self._identities[trace] = identity
+        return self._identities[trace]
+
+    def _alignment_key(self, kind):
+        """return the memo key of an alignment with the current windows"""
+        return alignment_key(
+            kind,
+            *[(self._identity(trace),
+               tuple(float(edge) for edge in self.window(trace)))
+              for trace in TRACES],
+            dtw_options=self.dtw_options
+        )
+
+    def _recall(self, kind):
+        """return the memoized path of an alignment, or None"""
+        if self.alignment_cache is None:
+            return None
+        return self.alignment_cache.get(self._alignment_key(kind))
+
+    def _memoize(self, kind, path):
+        """remember the path of an alignment"""
+        if self.alignment_cache is not None:
+            self.alignment_cache.put(self._alignment_key(kind), path)
+
+    def _dtw(self, kind, query, template):
+        """return the DTW path between two series"""
+        with self.timer.stage('dtw_' + kind, len(query) * len(template)):
+            if self.incremental:
+                return self.incremental[kind].align(query, template)[1:3]
+            return dtw(query, template, **self.dtw_options)[1:3]
+
+    def _compute_picked(self, trace):
+        """cut the window out of a trace and normalise it"""
+        times, signal = self.data[trace]
+        start, finish = self.window(trace)
+        pick = np.logical_and(start <= times, times <= finish)
+        times = np.extract(pick, times)
+        signal = np.extract(pick, signal)
+        absmax = np.max(np.abs(signal))
+        return times, signal / absmax
+
+    def _compute_analytic(self, trace):
+        """compute the envelope and phase of the picked signal"""
+        # unpadded: zero padding changes the transform near the window
+        # edges, and scipy.fft already handles prime lengths quickly
+        analytic = hilbert(self.picked(trace)[1])
+        return np.abs(analytic), np.angle(analytic) / np.pi
+
+    def _compute_picks(self, trace):
+        """propose a pick inside the window"""
+        times, signal = self.picked(trace)
+        return times[aic(signal)], None
+
+    def _compute_velocity(self, trace):
+        """compute time and velocity from the picks"""
+        time_mean, time_std = self.time_picks(trace)
+        time = (
+            time_mean if time_std == 0.0
+            else uncertainties.ufloat(time_mean, time_std)
+        )
+        return time, (self.length / time) * 1e4
+
+
+def load_range(start, finish, margin):
+    """return the (start, end) times of a trace to load
+
+    Only a trace with a margin and both window edges is cut down, to the
+    window plus the margin either side. The AIC proposal of the initial
+    pick then only sees that part of the trace.
+    """
+    if margin is None or not start or not finish:
+        return None, None
+    return start - margin, finish + margin
+
+
+def load_timed(path, cache_dir=None, timer=None, start=None, end=None):
+    """load a waveform file as the ``load`` stage of a timer"""
+    if timer is None:
+        return load_trace(path, cache_dir, start, end)
+    with timer.stage('load'):
+        return load_trace(path, cache_dir, start, end)
+
+
+def align_series(query, template, dtw_options):
+    """return the DTW path between two series and the seconds it took
+
+    A module function, so that the alignments of ``PickSession.alignments``
+    can run in a process pool.
+    """
+    begin = time.perf_counter()
+    path = dtw(query, template, **dtw_options)[1:3]
+    return path, time.perf_counter() - begin
+
+
+def get_mean(x):
+    if isinstance(x, float):
+        return x
+    return x.n
+
+
+def get_std(x):
+    if isinstance(x, float):
+        return 0.0
+    return x.s
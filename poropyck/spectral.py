@@ -0,0 +1,34 @@
+"""FFT based transforms of the numerical core
+
+``scipy.signal`` takes several times longer to import than ``scipy.fft``, so
+the two transforms the picker needs from it are computed here from
+``scipy.fft`` directly. Headless workers then never import it.
+"""
+import numpy as np
+from scipy.fft import fft, ifft, irfft, next_fast_len, rfft
+
+
+def hilbert(signal, n=None):
+    """return the analytic signal of a 1-D series, as ``scipy.signal.hilbert``
+
+    The series is zero padded to ``n`` samples before the transform.
+    """
+    n = len(signal) if n is None else n
+    spectrum = fft(signal, n)
+    # keep the zero (and Nyquist) frequency, double the positive
+    # frequencies and drop the negative ones
+    spectrum[1:(n + 1) // 2] *= 2.0
+    spectrum[n // 2 + 1:] = 0.0
+    return ifft(spectrum)
+
+
+def cross_correlate(x, y):
+    """return the full cross-correlation of two series and its lags
+
+    As ``scipy.signal.correlate`` with ``method='fft'``: entry ``k`` is the
+    sum of ``x[i + lags[k]] * y[i]``.
+    """
+    size = len(x) + len(y) - 1
+    fast = next_fast_len(size, real=True)
+    correlation = irfft(rfft(x, fast) * rfft(y[::-1], fast), fast)[:size]
+    return correlation, np.arange(-(len(y) - 1), len(x))
@@ -0,0 +1,271 @@
+"""Columnar storage of picks in chunked ``.npz`` files
+
+A store is a directory of ``chunk-NNNNNN.npz`` files, each holding one array
+per column for a run of picks, and a ``pending-NNNNNN.jsonl`` file with one
+line for each pick since the last full chunk. Each line is written as soon
+as its pick is appended, so an interrupted batch keeps every pick it
+reported. The pending file is numbered after the chunk its rows will become,
+so once that chunk exists a left over pending file is known to be stale.
+"""
+import json
+import os
+import re
+import zipfile
+
+import numpy as np
+
+CHUNK_ROWS = 1024
+CHUNK_PATTERN = re.compile(r'chunk-(\d+)\.npz$')
+PENDING_PATTERN = re.compile(r'pending-(\d+)\.jsonl$')
+
+# the columns of a pick, in the order of the output JSON
+PICK_COLUMNS = ('file', 'window_start', 'window_end', 'distance',
+                'distance_error', 'time', 'time_error', 'velocity',
+                'velocity_error')
+TEMPLATE_COLUMNS = ('file', 'window_start', 'window_end', 'time',
+                    'time_error', 'velocity', 'velocity_error')
+
+
+def flatten(pick, **extra):
+    """return the columns of a pick dictionary as one flat row
+
+    Template fields are prefixed with ``template_``. Extra keyword arguments
+    (such as ``sample`` or ``pressure``) become columns of their own.
+    """
+    row = {name: pick[name] for name in PICK_COLUMNS}
+    row.update(('template_' + name, pick['template'][name])
+               for name in TEMPLATE_COLUMNS)
+    row.update(extra)
+    return row
+
+
+def unflatten(row):
+    """return a flat row in the layout of a pick dictionary"""
+    pick = {name: value for name, value in row.items()
+            if not name.startswith('template_')}
+    pick['template'] = {name[len('template_'):]: value
+                        for name, value in row.items()
+                        if name.startswith('template_')}
+    return pick
+
+
+def _column(values):
+    """return the array of one column, with None (a missing pick) as NaN"""
+    if any(isinstance(value, str) for value in values):
+        return np.array(['' if value is None else value for value in values])
+    if all(isinstance(value, (int, np.integer)) and not isinstance(value, bool)
+           for value in values):
+        return np.array(values, dtype=int)
+    return np.array([np.nan if value is None else value for value in values],
+                    dtype=float)
+
+
+def _json(value):
+    """convert a NumPy scalar for JSON"""
+    return value.item()
+
+
+def _python(value):
+    """convert an array element back to a JSON compatible value"""
+    if isinstance(value, np.str_):
+        return str(value)
+    value = value.item()
+    return None if isinstance(value, float) and np.isnan(value) else value
+
+
+class ResultStore:
+    """picks stored column by column, appended to as they are made
+
+    Rows are buffered and written as ``chunk_rows`` rows per chunk file.
+    The first append or flush picks up the pending rows of an existing
+    store, so appending can resume after a crash. A store has one writer at
+    a time; opening it only to read (for example to watch a running batch)
+    never changes its files.
+    """
+
+    def __init__(self, directory, chunk_rows=CHUNK_ROWS):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        os.makedirs(directory, exist_ok=True)
+        # the writer's buffered rows and next chunk index, set by _resume
+        self._rows = None
+        self._index = None
+
+    def chunks(self):
+        """return the paths of the full chunk files, in order"""
+        names = sorted(name for name in os.listdir(self.directory)
+                       if CHUNK_PATTERN.match(name))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _pending(self, index):
+        """return the pending file of the rows that will become a chunk"""
+        return os.path.join(self.directory,
+                            'pending-{:06d}.jsonl'.format(index))
+
+    def _resume(self):
+        """take over the pending rows before the first write
+
+        Pending files of chunks that were already written (by a flush that
+        crashed before removing them) are deleted, and a line of the live
+        one cut short by a crash is dropped before appending after it.
+        """
+        if self._rows is not None:
+            return
+        self._index = _next_index(self.chunks())
+        for name in os.listdir(self.directory):
+            match = PENDING_PATTERN.match(name)
+            if match and int(match.group(1)) < self._index:
+                os.remove(os.path.join(self.directory, name))
+        pending = self._pending(self._index)
+        self._rows = _read_pending(pending)
+        if os.path.exists(pending):
+            partial = '{}.{}.tmp'.format(pending, os.getpid())
+            with open(partial, 'w') as clean:
+                clean.writelines(json.dumps(row, default=_json) + '\n'
+                                 for row in self._rows)
+            os.replace(partial, pending)
+
+    def append(self, pick, **extra):
+        """store a pick dictionary, with any extra columns"""
+        self.append_row(flatten(pick, **extra))
+
+    def append_row(self, row):
+        """store one flat row
+
+        All rows of a chunk share their columns, so a row with different
+        columns first closes the chunk in progress.
+        """
+        self._resume()
+        if self._rows and set(row) != set(self._rows[0]):
+            self.flush()
+        self._rows.append(row)
+        if len(self._rows) >= self.chunk_rows:
+            self.flush()
+        else:
+            with open(self._pending(self._index), 'a') as pending:
+                pending.write(json.dumps(row, default=_json) + '\n')
+
+    def flush(self):
+        """write the buffered rows as a full chunk"""
+        self._resume()
+        if not self._rows:
+            return
+        self._write(os.path.join(self.directory,
+                                 'chunk-{:06d}.npz'.format(self._index)))
+        # a crash here leaves a pending file that the new chunk marks stale
+        pending = self._pending(self._index)
+        if os.path.exists(pending):
+            os.remove(pending)
+        self._rows = []
+        self._index += 1
+
+    def _write(self, path):
+        """save the buffered rows to a file, replacing it atomically"""
+        columns = _columns(self._rows)
+        partial = '{}.{}.tmp'.format(path, os.getpid())
+        # the layout of np.savez, which cannot take a column named 'file'
+        with zipfile.ZipFile(partial, 'w') as npzfile:
+            for name, array in columns.items():
+                with npzfile.open(name + '.npy', 'w') as npyfile:
+                    np.lib.format.write_array(npyfile, array)
+        os.replace(partial, path)
+
+    def read(self, columns=None, **filters):
+        """return the stored columns as arrays, keeping only matching rows
+
+        Each filter names a column and gives a value to match, a list of
+        values, or a ``(low, high)`` tuple for an inclusive range, for
+        example ``read(sample='NM8A', pressure=(2000, 6000))``. Values
+        missing from a chunk are NaN (or empty strings).
+        """
+        index = _next_index(self.chunks())
+        pending = _read_pending(self._pending(index))
+        chunks = self.chunks()
+        if _next_index(chunks) > index:
+            # flushed since listing, so the pending rows are in a chunk
+            pending = []
+        parts = []
+        for path in chunks:
+            with np.load(path) as chunk:
+                parts.append(_select(chunk, columns, filters))
+        if pending:
+            parts.append(_select(_columns(pending), columns, filters))
+        parts = [part for part in parts if part]
+        return _concatenate(parts, columns)
+
+    def picks(self, **filters):
+        """return the matching rows in the layout of pick dictionaries"""
+        data = self.read(**filters)
+        count = len(next(iter(data.values()), []))
+        return [unflatten({name: _python(array[i])
+                           for name, array in data.items()})
+                for i in range(count)]
+
+
+def _next_index(chunks):
+    """return the index of the chunk after some chunk paths"""
+    if not chunks:
+        return 0
+    return int(CHUNK_PATTERN.search(chunks[-1]).group(1)) + 1
+
+
+def _read_pending(path):
+    """return the rows of a pending file, ignoring a partly written line"""
+    rows = []
+    if os.path.exists(path):
+        with open(path) as pending:
+            for line in pending:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    break
+    return rows
+
+
+def _columns(rows):
+    """return the columns of some flat rows as arrays"""
+    return {name: _column([row[name] for row in rows]) for name in rows[0]}
+
+
+def _select(chunk, columns, filters):
+    """return the matching rows of a chunk's columns, or None if none match
+
+    Only the filtered columns are read from a chunk without a match.
+    """
+    if any(name not in chunk for name in filters):
+        return None
+    keep = None
+    for name, wanted in filters.items():
+        match = _matches(chunk[name], wanted)
+        keep = match if keep is None else keep & match
+    if keep is not None and not keep.any():
+        return None
+    names = list(chunk) if columns is None else columns
+    return {name: chunk[name] if keep is None else chunk[name][keep]
+            for name in names if name in chunk}
+
+
+def _matches(values, wanted):
+    """return which values match a filter"""
+    if isinstance(wanted, tuple):
+        low, high = wanted
+        return (values >= low) & (values <= high)
+    if isinstance(wanted, list):
+        return np.isin(values, wanted)
+    return values == wanted
+
+
+def _concatenate(parts, columns=None):
+    """join the columns of several chunks, filling in missing columns"""
+    names = list(columns or [])
+    for part in parts:
+        names.extend(name for name in part if name not in names)
+    data = {}
+    for name in names:
+        arrays = [part[name] for part in parts if name in part]
+        kind = arrays[0].dtype if arrays else float
+        filler = '' if np.dtype(kind).kind == 'U' else np.nan
+        data[name] = np.concatenate(
+            [part.get(name, np.full(len(next(iter(part.values()))), filler))
+             for part in parts]) if parts else np.zeros(0)
+    return data
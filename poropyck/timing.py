@@ -0,0 +1,139 @@
+"""Opt-in timing and profiling of the pick pipeline stages"""
+import contextlib
+import cProfile
+import functools
+import io
+import json
+import pstats
+import threading
+import time
+
+# returned by disabled timers, so an untimed stage costs one attribute check
+_UNTIMED = contextlib.nullcontext()
+
+
+class Timer:
+    """wall time, call counts and sizes of named pipeline stages
+
+    Wrap a stage in ``with timer.stage(name, size):``. For each stage the
+    number of calls, the total and longest wall time in seconds and the
+    largest ``size`` seen are kept (samples in, or cost matrix cells for the
+    DTW stages). Given an executor, the DTW alignments run concurrently, so
+    their times can add up to more than the wall time of ``run_dtw``.
+
+    ``profile_next(name)`` runs the next call of a stage under cProfile. A
+    timer created with ``enabled=False`` records nothing.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = {}
+        self.profiles = {}
+        self._profile_next = set()
+        self._lock = threading.Lock()
+
+    def stage(self, name, size=None):
+        """return a context manager timing one call of a stage"""
+        if not self.enabled:
+            return _UNTIMED
+        return self._timed(name, size)
+
+    @contextlib.contextmanager
+    def _timed(self, name, size):
+        """time (and perhaps profile) the body of the with statement"""
+        profiler = None
+        if name in self._profile_next:
+            self._profile_next.discard(name)
+            profiler = cProfile.Profile()
+            profiler.enable()
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - begin
+            if profiler is not None:
+                profiler.disable()
+                self.profiles[name] = profiler
+            self.record(name, seconds, size)
+
+    def record(self, name, seconds, size=None):
+        """add one call of a stage"""
+        if not self.enabled:
+            return
+        with self._lock:
+            stage = self._entry(name)
+            stage['calls'] += 1
+            stage['seconds'] += seconds
+            stage['max_seconds'] = max(stage['max_seconds'], seconds)
+            if size is not None:
+                stage['size'] = max(stage['size'] or 0, int(size))
+
+    def merge(self, stages):
+        """add the stages recorded by another timer, such as a worker's"""
+        if not self.enabled:
+            return
+        with self._lock:
+            for name, other in stages.items():
+                stage = self._entry(name)
+                stage['calls'] += other['calls']
+                stage['seconds'] += other['seconds']
+                stage['max_seconds'] = max(stage['max_seconds'],
+                                           other['max_seconds'])
+                if other['size'] is not None:
+                    stage['size'] = max(stage['size'] or 0, other['size'])
+
+    def _entry(self, name):
+        """return the record of a stage, started if new (hold the lock)"""
+        return self.stages.setdefault(
+            name, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                   'size': None})
+
+    def profile_next(self, name):
+        """run the next call of a stage (such as ``onmotion``) under cProfile
+
+        Only one profiler can run at a time, so profile event handlers and
+        other stages that run on the main thread.
+        """
+        self._profile_next.add(name)
+
+    def profile_report(self, name, sort='cumulative', limit=25):
+        """return the cProfile statistics of a profiled stage as text"""
+        stream = io.StringIO()
+        stats = pstats.Stats(self.profiles[name], stream=stream)
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def reset(self):
+        """forget all recorded stages and profiles"""
+        with self._lock:
+            self.stages = {}
+            self.profiles = {}
+
+    def as_dict(self):
+        """return the stages, and any profile reports, as a dictionary"""
+        with self._lock:
+            stages = {name: dict(stage) for name, stage in self.stages.items()}
+        return {
+            'stages': stages,
+            'profiles': {name: self.profile_report(name)
+                         for name in self.profiles}
+        }
+
+    def to_json(self, path=None):
+        """return the ``as_dict`` data as JSON, also writing it to ``path``"""
+        text = json.dumps(self.as_dict(), indent=2)
+        if path is not None:
+            with open(path, 'w') as jsonfile:
+                jsonfile.write(text)
+        return text
+
+
+def timed(name):
+    """time a method as a stage of the ``timer`` of its object"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.timer.stage(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
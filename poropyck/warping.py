@@ -0,0 +1,441 @@
+"""Dynamic time warping engine
+
+The accumulated cost is built one row at a time. Each row is computed with
+NumPy operations only: moves from the previous row are a plain element-wise
+minimum, and the chain of horizontal moves within the row is resolved with a
+running minimum over cumulative sums. Only the cells inside a window (one
+``[lo, hi)`` column range per row) are evaluated or stored.
+
+Paths use the conventions of the original ``dtw`` extension: the returned
+indices are 1-based, ``indices1`` into the first series and ``indices2`` into
+the second.
+"""
+import time
+
+import numpy as np
+
+from .spectral import cross_correlate
+
+WINDOWS = ('full', 'sakoe-chiba', 'itakura', 'multiscale', 'xcorr')
+
+# below this correlation an estimated lag is not trusted to place a band
+MIN_LAG_CONFIDENCE = 0.5
+
+
+def full_window(n, m):
+    """return the unconstrained window"""
+    return np.zeros(n, dtype=int), np.full(n, m, dtype=int)
+
+
+def sakoe_chiba_window(n, m, radius):
+    """return a band of +/- radius columns around the (scaled) diagonal"""
+    centre = np.arange(n) * ((m - 1) / max(n - 1, 1))
+    lo = np.floor(centre - radius).astype(int)
+    hi = np.ceil(centre + radius).astype(int) + 1
+    return valid_window(lo, hi, m)
+
+
+def itakura_window(n, m, max_slope=2.0):
+    """return an Itakura parallelogram with the given maximum path slope"""
+    if n < 2 or m < 2:
+        return full_window(n, m)
+    x = np.arange(n) / (n - 1)
+    lower = np.maximum(x / max_slope, 1 - max_slope * (1 - x))
+    upper = np.minimum(max_slope * x, 1 - (1 - x) / max_slope)
+    lo = np.ceil(lower * (m - 1) - 1e-9).astype(int)
+    hi = np.floor(upper * (m - 1) + 1e-9).astype(int) + 1
+    return valid_window(lo, hi, m)
+
+
+def estimate_lag(x, y):
+    """estimate the bulk shift between two series by cross-correlation
+
+    The correlation is computed by FFT. Returns ``(lag, confidence)``: the
+    shift in samples such that ``x[i + lag]`` best matches ``y[i]``, and the
+    normalised correlation at that shift (1 for a pure shift, near 0 for
+    unrelated series).
+    """
+    x = np.asarray(x, dtype=float) - np.mean(x)
+    y = np.asarray(y, dtype=float) - np.mean(y)
+    scale = np.sqrt(np.sum(x**2) * np.sum(y**2))
+    if scale == 0:
+        return 0, 0.0
+    correlation, lags = cross_correlate(x, y)
+    peak = np.argmax(correlation)
+    return int(lags[peak]), float(correlation[peak] / scale)
+
+
+def lag_window(n, m, lag, radius):
+    """return a band of +/- radius columns around the diagonal shifted by lag
+
+    Row ``i`` is centred on column ``i - lag``, as found by ``estimate_lag``.
+    """
+    centre = np.arange(n) - lag
+    return valid_window(centre - radius, centre + radius + 1, m)
+
+
+def xcorr_window(x, y, radius=None):
+    """return a lag window placed by cross-correlating two series
+
+    The band has half-width ``radius`` (a tenth of the longer series by
+    default). If the correlation is below ``MIN_LAG_CONFIDENCE`` the lag
+    cannot be trusted, and the full window is returned.
+    """
+    lag, confidence = estimate_lag(x, y)
+    if confidence < MIN_LAG_CONFIDENCE:
+        return full_window(len(x), len(y))
+    if radius is None:
+        radius = max(len(x), len(y)) // 10
+    return lag_window(len(x), len(y), lag, radius)
+
+
+def valid_window(lo, hi, m):
+    """widen a window just enough for a path to cross it
+
+    A path starts at the first cell, ends at the last cell and each step
+    moves at most one row and one column, so the column ranges must start
+    and finish at the corners, never shrink backwards and overlap between
+    neighbouring rows.
+    """
+    lo = np.clip(np.asarray(lo, dtype=int), 0, m - 1)
+    hi = np.clip(np.asarray(hi, dtype=int), 1, m)
+    lo[0] = 0
+    hi[-1] = m
+    lo = np.minimum.accumulate(lo[::-1])[::-1]
+    hi = np.maximum.accumulate(np.maximum(hi, lo + 1))
+    lo[1:] = np.minimum(lo[1:], hi[:-1])
+    return lo, hi
+
+
+def make_window(n, m, window=None, radius=None, max_slope=2.0):
+    """return the (lo, hi) column ranges of a named window
+
+    ``window`` is one of ``'full'``, ``'sakoe-chiba'`` (of half-width
+    ``radius``) or ``'itakura'`` (with ``max_slope``), or a ``(lo, hi)``
+    tuple of per-row column ranges. By default the window is full, unless a
+    radius is given, which implies a Sakoe-Chiba band. The ``'multiscale'``
+    and ``'xcorr'`` windows depend on the data, so they are handled by
+    ``dtw`` itself.
+    """
+    if window is None:
+        window = 'full' if radius is None else 'sakoe-chiba'
+    if isinstance(window, str):
+        if window == 'full':
+            return full_window(n, m)
+        if window == 'sakoe-chiba':
+            if radius is None:
+                raise ValueError('a Sakoe-Chiba window needs a radius')
+            return sakoe_chiba_window(n, m, radius)
+        if window == 'itakura':
+            return itakura_window(n, m, max_slope)
+        raise ValueError('unknown window {!r}, expected one of {}'.format(
+            window, ', '.join(WINDOWS)))
+    lo, hi = window
+    if len(lo) != n or len(hi) != n:
+        raise ValueError('window must have one column range per row')
+    return valid_window(lo, hi, m)
+
+
+def series_window(x, y, window=None, radius=None, max_slope=2.0):
+    """return the (lo, hi) column ranges of a window for two series
+
+    This is ``make_window``, also accepting ``'xcorr'`` (see
+    ``xcorr_window``).
+    """
+    if isinstance(window, str) and window == 'xcorr':
+        return xcorr_window(x, y, radius)
+    return make_window(len(x), len(y), window, radius, max_slope)
+
+
+def _shifted(row, row_lo, start, stop):
+    """values of a stored row for columns [start, stop), inf outside it"""
+    out = np.full(stop - start, np.inf)
+    first = max(start, row_lo)
+    last = min(stop, row_lo + len(row))
+    if first < last:
+        out[first - start:last - start] = row[first - row_lo:last - row_lo]
+    return out
+
+
+def accumulate(x, y, lo, hi, max_dist=np.inf, keep=True):
+    """return the accumulated cost rows of two series inside a window
+
+    If ``keep`` is false only the final row is returned, so memory is bound
+    by the window width. Returns ``None`` as soon as every cell of a row
+    exceeds ``max_dist``, since every path crosses every row.
+    """
+    rows = []
+    row = None
+    for i in range(len(x)):
+        start, stop = lo[i], hi[i]
+        cost = np.abs(x[i] - y[start:stop])
+        total = np.cumsum(cost)
+        if row is None:
+            row = total
+        else:
+            above = _shifted(row, lo[i - 1], start, stop)
+            diagonal = _shifted(row, lo[i - 1], start - 1, stop - 1)
+            step = cost + np.minimum(above, diagonal)
+            # horizontal moves: row[j] = min(step[j], cost[j] + row[j - 1])
+            row = total + np.minimum.accumulate(step - total)
+        if row.min() > max_dist:
+            return None
+        if keep:
+            rows.append(row)
+    return rows if keep else [row]
+
+
+def backtrack(rows, lo):
+    """return the optimal path through accumulated cost rows"""
+    def cost(i, j):
+        if i < 0 or j < lo[i] or j >= lo[i] + len(rows[i]):
+            return np.inf
+        return rows[i][j - lo[i]]
+
+    i = len(rows) - 1
+    j = lo[i] + len(rows[i]) - 1
+    path = [(i, j)]
+    while i > 0 or j > 0:
+        best = cost(i - 1, j - 1)
+        step = (i - 1, j - 1)
+        if cost(i - 1, j) < best:
+            best = cost(i - 1, j)
+            step = (i - 1, j)
+        if cost(i, j - 1) < best:
+            step = (i, j - 1)
+        i, j = step
+        path.append(step)
+    return np.array(path[::-1]).T
+
+
+def dtw(x, y, window=None, radius=None, max_slope=2.0):
+    """align two series with dynamic time warping
+
+    Returns ``(distance, indices1, indices2)`` where the indices are 1-based
+    positions along the warping path in ``x`` and ``y``. See ``make_window``
+    for the window options; ``window='multiscale'`` uses ``multiscale_dtw``
+    with the given radius (default 1) and ``window='xcorr'`` searches a band
+    of that radius around the lag found by cross-correlation (see
+    ``xcorr_window``).
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if isinstance(window, str) and window == 'multiscale':
+        return multiscale_dtw(x, y, 1 if radius is None else radius)
+    lo, hi = series_window(x, y, window, radius, max_slope)
+    rows = accumulate(x, y, lo, hi)
+    indices1, indices2 = backtrack(rows, lo) + 1
+    return rows[-1][-1], indices1, indices2
+
+
+class IncrementalDTW:
+    """dynamic time warping that reuses the previous alignment
+
+    The accumulated cost of a cell only depends on the samples up to it, so
+    when the series change only at their ends (a window edge moved) the
+    cost rows and columns before the first changed sample are kept and only
+    the rest is computed. Moving the start of a window changes every prefix,
+    so the rows are then accumulated from the end of the series instead,
+    and later moves of the same edge reuse them. Which samples are unchanged
+    is found by comparing values, so a rescaled series is simply recomputed.
+
+    Only the full window can be reused, as banded windows change shape with
+    the series lengths; other options are passed on to ``dtw``. Where two
+    paths cost the same, the path found may differ from that of ``dtw``.
+    """
+
+    def __init__(self, window=None, radius=None, max_slope=2.0):
+        self.options = {'window': window, 'radius': radius,
+                        'max_slope': max_slope}
+        self.full = window == 'full' or (window is None and radius is None)
+        self.x = None
+        self.y = None
+        self.rows = None
+        self.reverse = False
+        self.reused = 0.0
+
+    def align(self, x, y):
+        """align two series, returning the same as ``dtw``"""
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if not self.full:
+            return dtw(x, y, **self.options)
+        kept = self._kept(x, y, self.reverse)
+        if self.rows is not None and not all(kept):
+            # nothing is shared at this end, so start again from the other
+            if all(self._kept(x, y, not self.reverse)):
+                self.reverse = not self.reverse
+            kept = (0, 0)
+        self.x, self.y = x, y
+        if self.reverse:
+            x, y = x[::-1], y[::-1]
+        self.rows = extend(x, y, self.rows, *kept)
+        self.reused = kept[0] * kept[1] / (len(x) * len(y))
+        indices1, indices2 = backtrack(self.rows, np.zeros(len(x), int))
+        if self.reverse:
+            indices1 = len(x) - 1 - indices1[::-1]
+            indices2 = len(y) - 1 - indices2[::-1]
+        return self.rows[-1][-1], indices1 + 1, indices2 + 1
+
+    def _kept(self, x, y, reverse):
+        """the rows and columns of the stored costs still valid for x and y"""
+        if self.rows is None:
+            return 0, 0
+        if reverse:
+            return (_common_prefix(x[::-1], self.x[::-1]),
+                    _common_prefix(y[::-1], self.y[::-1]))
+        return _common_prefix(x, self.x), _common_prefix(y, self.y)
+
+
+def _common_prefix(a, b):
+    """the number of leading samples two series share"""
+    length = min(len(a), len(b))
+    changed = np.flatnonzero(a[:length] != b[:length])
+    return changed[0] if len(changed) else length
+
+
+def extend(x, y, rows, kept_rows, kept_columns):
+    """return full-window cost rows, reusing the first of the given ones
+
+    The first ``kept_columns`` cells of the first ``kept_rows`` rows are
+    kept; every other cell is computed.
+    """
+    new_rows = []
+    for i in range(len(x)):
+        start = min(kept_columns, len(y)) if i < kept_rows else 0
+        old = rows[i][:start] if start else np.zeros(0)
+        if start == len(y):
+            new_rows.append(old)
+            continue
+        cost = np.abs(x[i] - y[start:])
+        total = np.cumsum(cost)
+        # the cheapest way into the first new cell from the left
+        left = old[-1] if start else (0.0 if i == 0 else np.inf)
+        if i == 0:
+            row = left + total
+        else:
+            above = new_rows[i - 1][start:]
+            diagonal = _shifted(new_rows[i - 1], 0, start - 1, len(y) - 1)
+            step = cost + np.minimum(above, diagonal)
+            row = total + np.minimum(
+                left, np.minimum.accumulate(step - total))
+        new_rows.append(np.concatenate([old, row]) if start else row)
+    return new_rows
+
+
+def lb_keogh(x, y, window=None, radius=None, max_slope=2.0):
+    """return the LB_Keogh lower bound of the DTW distance
+
+    Each sample of ``x`` is matched somewhere in its window row, so it costs
+    at least its distance to the envelope of ``y`` over that row.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    lo, hi = series_window(x, y, window, radius, max_slope)
+    # reduce over y[lo:hi] for every row at once (the odd entries are unused)
+    bounds = np.column_stack([lo, hi]).ravel()
+    padded = np.append(y, 0.0)
+    upper = np.maximum.reduceat(padded, bounds)[::2]
+    lower = np.minimum.reduceat(padded, bounds)[::2]
+    return np.sum(np.abs(x - np.clip(x, lower, upper)))
+
+
+def dtw_distance(x, y, window=None, radius=None, max_slope=2.0,
+                 max_dist=np.inf):
+    """return the DTW distance of two series without the path
+
+    Only one cost row is kept. Without a band the series are swapped so that
+    the row runs along the shorter one (a band is already narrow). If
+    ``max_dist`` is given the alignment is abandoned (returning inf) as soon
+    as it is known to exceed it, first by the LB_Keogh bound and then row by
+    row. Distances above ``max_dist`` are always returned as inf.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if isinstance(window, str) and window == 'multiscale':
+        distance = dtw(x, y, window, radius)[0]
+        return distance if distance <= max_dist else np.inf
+    unbanded = window == 'full' or (window is None and radius is None)
+    if unbanded and len(y) > len(x):
+        x, y = y, x
+    lo, hi = series_window(x, y, window, radius, max_slope)
+    if max_dist < np.inf and lb_keogh(x, y, (lo, hi)) > max_dist:
+        return np.inf
+    rows = accumulate(x, y, lo, hi, max_dist, keep=False)
+    if rows is None or rows[-1][-1] > max_dist:
+        return np.inf
+    return rows[-1][-1]
+
+
+def coarsen(x):
+    """halve the resolution of a series by averaging pairs of samples"""
+    pairs = (x[:len(x) // 2 * 2:2] + x[1::2]) / 2
+    return np.append(pairs, x[-1]) if len(x) % 2 else pairs
+
+
+def project_path(indices1, indices2, n, m, radius):
+    """return the window of a coarse path projected to the finer level
+
+    Every coarse cell covers a 2 x 2 block of fine cells, which is widened
+    by ``radius`` cells on every side. ``indices1`` and ``indices2`` are the
+    1-based coarse path.
+    """
+    lo = np.full(n, m)
+    hi = np.zeros(n, dtype=int)
+    rows = 2 * (np.asarray(indices1) - 1)
+    columns = 2 * (np.asarray(indices2) - 1)
+    for offset in range(-radius, radius + 2):
+        row = np.clip(rows + offset, 0, n - 1)
+        np.minimum.at(lo, row, columns - radius)
+        np.maximum.at(hi, row, columns + radius + 2)
+    return valid_window(lo, hi, m)
+
+
+def multiscale_dtw(x, y, radius=1):
+    """approximate dynamic time warping, coarse to fine (as in FastDTW)
+
+    The series are repeatedly halved in resolution, aligned exactly at the
+    coarsest level, and the path is then refined at each finer level inside
+    the projected corridor of half-width ``radius``. The cost grows roughly
+    linearly with the series length, at the price of a possibly sub-optimal
+    path (see ``multiscale_report``). Returns the same as ``dtw``.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if min(len(x), len(y)) <= radius + 2:
+        return dtw(x, y)
+    _, indices1, indices2 = multiscale_dtw(coarsen(x), coarsen(y), radius)
+    window = project_path(indices1, indices2, len(x), len(y), radius)
+    return dtw(x, y, window)
+
+
+def multiscale_report(x, y, radius=1):
+    """compare multiscale and exact dynamic time warping of two series
+
+    Returns a dictionary with both distances, the relative distance error,
+    the largest difference between the paths (in samples of ``y`` for each
+    sample of ``x``) and both run times in seconds.
+    """
+    started = time.perf_counter()
+    exact = dtw(x, y)
+    exact_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    approx = multiscale_dtw(x, y, radius)
+    seconds = time.perf_counter() - started
+
+    def mean_match(indices1, indices2):
+        """mean matched position in y for every sample of x"""
+        counts = np.bincount(indices1 - 1, minlength=len(x))
+        return np.bincount(indices1 - 1, indices2, len(x)) / counts
+
+    return {
+        'radius': radius,
+        'exact_distance': exact[0],
+        'distance': approx[0],
+        'distance_error': (
+            (approx[0] - exact[0]) / exact[0] if exact[0] else 0.0),
+        'path_error': np.max(np.abs(
+            mean_match(*approx[1:]) - mean_match(*exact[1:]))),
+        'exact_seconds': exact_seconds,
+        'seconds': seconds,
+    }
@@ -6,5 +6,8 @@ setup(
     version='1.7.0',
     author='Paul Freeman',
     author_email='paul.freeman.cs@gmail.com',
-    packages=find_packages()
+    packages=find_packages(exclude=['benchmarks']),
+    entry_points={
+        'console_scripts': ['poropyck = poropyck.cli:main'],
+    }
 )
@@ -0,0 +1,55 @@
+"""AIC picking against the original per-sample loop"""
+import numpy as np
+import pytest
+
+from poropyck.onset import aic, aic_curve
+
+
+def loop_aic(signal):
+    """the quadratic AIC picker that ``aic_curve`` replaced"""
+    length = len(signal)
+    output = [0]
+    with np.errstate(divide='ignore'):
+        for k in range(1, length - 1):
+            val = (k * np.log(np.var(signal[0:k])) +
+                   (length-k-1) * np.log(np.var(signal[k+1:length])))
+            if val == -np.inf:
+                val = 0
+            output.append(val)
+    output.append(0)
+    return np.argmin(output)
+
+
+def traces(count=200, seed=0):
+    """random traces, some with zero padding at either end"""
+    rng = np.random.default_rng(seed)
+    for i in range(count):
+        trace = (rng.normal(size=rng.integers(20, 300)) *
+                 10**rng.uniform(-6, 3) + rng.uniform(-5, 5))
+        if i % 4 in (1, 3):
+            trace = np.r_[np.zeros(rng.integers(1, 100)), trace]
+        if i % 4 in (2, 3):
+            trace = np.r_[trace, np.zeros(rng.integers(1, 100))]
+        yield trace
+
+
+@pytest.mark.parametrize('trace', list(traces()))
+def test_same_pick_as_loop(trace):
+    assert aic(trace) == loop_aic(trace)
+
+
+def test_zero_pretrigger():
+    noise = np.random.default_rng(1).normal(size=100)
+    trace = np.r_[np.zeros(50), noise]
+    assert aic(trace) == loop_aic(trace) == 51
+
+
+def test_flat():
+    assert aic(np.zeros(10)) == loop_aic(np.zeros(10)) == 0
+    assert not aic_curve(np.full(10, 0.1)).any()
+
+
+def test_stack():
+    stack = np.stack([trace[:40] for trace in traces(10, seed=2)
+                      if len(trace) >= 40])
+    assert list(aic(stack)) == [loop_aic(trace) for trace in stack]
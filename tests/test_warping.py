@@ -0,0 +1,116 @@
+"""DTW engine against a brute force O(N M) reference"""
+import numpy as np
+import pytest
+
+from poropyck.warping import (IncrementalDTW, dtw, dtw_distance, lb_keogh,
+                              multiscale_dtw, series_window)
+
+
+def brute_force(x, y, lo=None, hi=None):
+    """return the DTW distance of two series, cell by cell in a window"""
+    n, m = len(x), len(y)
+    lo = np.zeros(n, dtype=int) if lo is None else lo
+    hi = np.full(n, m, dtype=int) if hi is None else hi
+    cost = np.full((n + 1, m + 1), np.inf)
+    cost[0, 0] = 0.0
+    for i in range(n):
+        for j in range(lo[i], hi[i]):
+            cost[i + 1, j + 1] = abs(x[i] - y[j]) + min(
+                cost[i, j], cost[i, j + 1], cost[i + 1, j])
+    return cost[n, m]
+
+
+def path_cost(x, y, indices1, indices2):
+    """return the cost of a 1-based path, checking that it is a valid path"""
+    steps = np.diff(np.column_stack([indices1, indices2]), axis=0)
+    assert (indices1[0], indices2[0]) == (1, 1)
+    assert (indices1[-1], indices2[-1]) == (len(x), len(y))
+    assert np.all((steps >= 0) & (steps <= 1))
+    assert np.all(steps.sum(axis=1) > 0)
+    return np.sum(np.abs(x[indices1 - 1] - y[indices2 - 1]))
+
+
+def pairs(count=40, seed=0):
+    """random series pairs of similar lengths"""
+    rng = np.random.default_rng(seed)
+    for _ in range(count):
+        n = rng.integers(5, 60)
+        m = rng.integers(max(3, n * 2 // 3), n * 3 // 2 + 2)
+        yield rng.normal(size=n), rng.normal(size=m)
+
+
+BANDS = [{}, {'window': 'full'}, {'radius': 3},
+         {'window': 'sakoe-chiba', 'radius': 6},
+         {'window': 'itakura', 'max_slope': 2.0}]
+
+
+@pytest.mark.parametrize('options', BANDS)
+def test_exact(options):
+    for x, y in pairs():
+        lo, hi = series_window(x, y, options.get('window'),
+                               options.get('radius'),
+                               options.get('max_slope', 2.0))
+        expected = brute_force(x, y, lo, hi)
+        distance, indices1, indices2 = dtw(x, y, **options)
+        assert distance == pytest.approx(expected)
+        assert path_cost(x, y, indices1, indices2) == pytest.approx(expected)
+        assert dtw_distance(x, y, **options) == pytest.approx(expected)
+
+
+def test_multiscale():
+    for x, y in pairs(seed=1):
+        distance, indices1, indices2 = multiscale_dtw(x, y, radius=1)
+        assert path_cost(x, y, indices1, indices2) == pytest.approx(distance)
+        assert distance >= brute_force(x, y) - 1e-9
+
+
+def test_early_abandoning():
+    for x, y in pairs(seed=2):
+        expected = brute_force(x, y)
+        assert dtw_distance(x, y, max_dist=expected * 1.01) == \
+            pytest.approx(expected)
+        assert dtw_distance(x, y, max_dist=expected * 0.99) == np.inf
+
+
+@pytest.mark.parametrize('options', BANDS)
+def test_lb_keogh(options):
+    for x, y in pairs(seed=3):
+        lo, hi = series_window(x, y, options.get('window'),
+                               options.get('radius'),
+                               options.get('max_slope', 2.0))
+        assert lb_keogh(x, y, **options) <= brute_force(x, y, lo, hi) + 1e-9
+
+
+def edge_moves(count=200, seed=4):
+    """windows of two long series, one start or end edge moved at a time"""
+    rng = np.random.default_rng(seed)
+    series = [rng.normal(size=120), rng.normal(size=120)]
+    edges = [[30, 70], [35, 80]]
+    for _ in range(count):
+        which, edge = rng.integers(2), rng.integers(2)
+        moved = edges[which][edge] + rng.integers(-4, 5)
+        if edge == 0:
+            edges[which][0] = int(np.clip(moved, 0, edges[which][1] - 5))
+        else:
+            edges[which][1] = int(np.clip(moved, edges[which][0] + 5, 120))
+        yield [data[start:end] for data, (start, end) in zip(series, edges)]
+
+
+def test_incremental():
+    aligner = IncrementalDTW()
+    reused = reversed_ = False
+    for x, y in edge_moves():
+        distance, indices1, indices2 = aligner.align(x, y)
+        expected = dtw(x, y)[0]
+        assert distance == pytest.approx(expected)
+        assert path_cost(x, y, indices1, indices2) == pytest.approx(expected)
+        reused |= aligner.reused > 0
+        reversed_ |= aligner.reverse
+    # both the forward and the reversed reuse were exercised
+    assert reused and reversed_
+
+
+def test_incremental_band():
+    aligner = IncrementalDTW(radius=3)
+    for x, y in edge_moves(20, seed=5):
+        assert aligner.align(x, y)[0] == pytest.approx(dtw(x, y, radius=3)[0])